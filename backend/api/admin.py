@@ -1,5 +1,6 @@
-from django.contrib import admin
-from .models import CompanyWallet, BankAccount, ProjectWallet, Transaction, Transfer, ProjectItem
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from .models import CompanyWallet, BankAccount, ProjectWallet, Transaction, Transfer, ProjectItem, RequestProfile
 
 class ProjectItemInLine(admin.TabularInline):
     model = ProjectItem
@@ -27,13 +28,23 @@ class ProjectWalletAdmin(admin.ModelAdmin):
         return f"{total:,.2f}"
     total_planned_cost.short_description = "Total Planned (RAB)"
 
+def reverse_entries(model_admin, request, queryset):
+    for entry in queryset:
+        try:
+            entry.reverse()
+        except ValidationError as exc:
+            model_admin.message_user(request, f"#{entry.pk}: {' '.join(exc.messages)}", messages.ERROR)
+        else:
+            model_admin.message_user(request, f"#{entry.pk} reversed.")
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('description', 'amount', 'transaction_type', 'date', 'account', 'project', 'project_item')
     list_filter = ('transaction_type', 'date', 'project') 
     search_fields = ('description', 'project__name')
     
-    readonly_fields = ('date',)
+    readonly_fields = ('date', 'reversal_of')
+    actions = ['reverse_selected']
 
     fieldsets = (
         ('Basic Info', {
@@ -46,11 +57,58 @@ class TransactionAdmin(admin.ModelAdmin):
             'fields': ('project', 'project_item')
         }),
         ('System Info', {
-            'fields': ('date',)
+            'fields': ('date', 'reversal_of')
         }),
     )
 
+    # ledger rows are cancelled with a reversal entry, never edited or deleted
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Reverse selected transactions")
+    def reverse_selected(self, request, queryset):
+        reverse_entries(self, request, queryset)
+
+@admin.register(Transfer)
+class TransferAdmin(admin.ModelAdmin):
+    list_display = ('from_account', 'to_account', 'amount', 'date', 'reversal_of')
+    readonly_fields = ('date', 'reversal_of')
+    actions = ['reverse_selected']
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Reverse selected transfers")
+    def reverse_selected(self, request, queryset):
+        reverse_entries(self, request, queryset)
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'user', 'duration_ms', 'query_count', 'sql_ms')
+    list_filter = ('method',)
+    search_fields = ('path', 'user')
+
+    readonly_fields = (
+        'created_at', 'method', 'path', 'user',
+        'duration_ms', 'query_count', 'sql_ms',
+        'profile_file', 'sql_file', 'summary'
+    )
+
+    def has_add_permission(self, request):
+        return False
+
 admin.site.register(CompanyWallet)
-admin.site.register(BankAccount)
+@admin.register(BankAccount)
+class BankAccountAdmin(admin.ModelAdmin):
+    list_display = ('name', 'account_number', 'balance', 'company')
+
+    # balances only change through postings
+    def get_readonly_fields(self, request, obj=None):
+        return ('balance',) if obj else ()
 admin.site.register(ProjectWallet, ProjectWalletAdmin)
-admin.site.register(Transfer)
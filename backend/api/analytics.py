@@ -0,0 +1,250 @@
+"""
+Columnar (Arrow IPC) snapshot of the ledger for analytics.
+
+`manage.py snapshot_ledger` appends every Transaction newer than the last
+snapshot to a new part file, denormalized with its account, project and RAB
+item. The analytics endpoints memory-map those files and aggregate them with
+Arrow compute, so heavy reports never touch the live tables.
+
+Project / item attributes are captured when a row is first snapshotted;
+`snapshot_ledger --full` rebuilds everything after renames or recategorizations.
+Each company gets its own snapshot directory. Needs the optional `pyarrow` package.
+"""
+import json
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # optional, analytics only
+    pa = None
+
+from .models import Transaction
+from core.tenants import current_company
+
+MANIFEST = "manifest.json"
+BATCH_SIZE = 50_000
+
+# snapshot column -> ORM lookup
+COLUMNS = {
+    "id": "id",
+    "date": "date",
+    "transaction_type": "transaction_type",
+    "amount": "amount",
+    "account_id": "account_id",
+    "account_name": "account__name",
+    "project_id": "project_id",
+    "project_name": "project__name",
+    "client_name": "project__client_name",
+    "project_status": "project__status",
+    "item_id": "project_item_id",
+    "item_name": "project_item__name",
+    "category": "project_item__category",
+    "sub_category": "project_item__sub_category",
+}
+
+GROUP_BY_CHOICES = [
+    "category", "sub_category", "item_name", "project_name", "client_name",
+    "project_status", "account_name", "date",
+]
+
+_cache_lock = threading.Lock()
+_cache = {}  # company id -> (manifest version, table)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_dir():
+    return Path(settings.LEDGER_SNAPSHOT_DIR) / f"company-{current_company()}"
+
+
+def require_pyarrow():
+    if pa is None:
+        raise SnapshotError("pyarrow is not installed (pip install pyarrow).")
+
+
+def schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("date", pa.date32()),
+        ("transaction_type", pa.string()),
+        ("amount", pa.decimal128(15, 2)),
+        ("account_id", pa.int64()),
+        ("account_name", pa.string()),
+        ("project_id", pa.int64()),
+        ("project_name", pa.string()),
+        ("client_name", pa.string()),
+        ("project_status", pa.string()),
+        ("item_id", pa.int64()),
+        ("item_name", pa.string()),
+        ("category", pa.string()),
+        ("sub_category", pa.string()),
+    ])
+
+
+def read_manifest():
+    path = snapshot_dir() / MANIFEST
+    if not path.exists():
+        return {"version": 0, "last_id": 0, "safe_id": 0, "checkpoints": [], "parts": []}
+    manifest = json.loads(path.read_text())
+    # manifests written before the rescan window trusted last_id
+    manifest.setdefault("safe_id", manifest["last_id"])
+    manifest.setdefault("checkpoints", [])
+    return manifest
+
+
+def _snapshotted_ids(directory, parts, above):
+    """Ids already in the snapshot parts that are greater than `above`"""
+    ids = set()
+    for part in parts:
+        column = pa.ipc.open_file(pa.memory_map(str(directory / part))).read_all()["id"]
+        ids.update(column.filter(pc.greater(column, above)).to_pylist())
+    return ids
+
+
+def write_snapshot(full=False):
+    """
+    Appends ledger rows not yet snapshotted as a new part, returns (rows written, manifest).
+
+    Ids are handed out before commit (Postgres), so a row may commit after a higher id
+    was snapshotted. Every run therefore re-reads from `safe_id`, the id below which all
+    rows were committed, and skips the ids it already has. A run's highest id becomes
+    safe once a run started LEDGER_SNAPSHOT_RESCAN_SECONDS after it (longer than any
+    posting stays open) has finished.
+    """
+    require_pyarrow()
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    started_at = time.time()
+
+    manifest = read_manifest()
+    # a full rebuild replaces the old parts only once its manifest is in place
+    replaced = manifest["parts"] if full else []
+    if full:
+        start = {**manifest, "last_id": 0, "safe_id": 0, "checkpoints": [], "parts": []}
+    else:
+        start = manifest
+
+    seen = _snapshotted_ids(directory, start["parts"], start["safe_id"])
+    rows = (
+        Transaction.objects.filter(company=current_company(), pk__gt=start["safe_id"])
+        .order_by("pk")
+        .values_list(*COLUMNS.values())
+    )
+
+    written = 0
+    last_id = start["last_id"]
+    part_name = f"ledger-{manifest['version'] + 1:06d}.arrow"
+
+    with pa.OSFile(str(directory / part_name), "wb") as sink:
+        with pa.ipc.new_file(sink, schema()) as writer:
+            batch = []
+            for row in rows.iterator(chunk_size=BATCH_SIZE):
+                if row[0] in seen:
+                    continue
+                batch.append(row)
+                if len(batch) == BATCH_SIZE:
+                    writer.write_batch(_record_batch(batch))
+                    written += len(batch)
+                    last_id = max(last_id, batch[-1][0])
+                    batch = []
+            if batch:
+                writer.write_batch(_record_batch(batch))
+                written += len(batch)
+                last_id = max(last_id, batch[-1][0])
+
+    if written:
+        version, parts = manifest["version"] + 1, start["parts"] + [part_name]
+    else:
+        (directory / part_name).unlink()
+        version, parts = manifest["version"], start["parts"]
+
+    # earlier runs a whole window older than this one: whatever they couldn't see is committed by now
+    checkpoints = start["checkpoints"] + [[started_at, last_id]]
+    settled = [cp for cp in checkpoints if cp[0] <= started_at - settings.LEDGER_SNAPSHOT_RESCAN_SECONDS]
+    safe_id = max([start["safe_id"]] + [cp[1] for cp in settled])
+
+    manifest = {
+        "version": version,
+        "last_id": last_id,
+        "safe_id": safe_id,
+        "checkpoints": [cp for cp in checkpoints if cp not in settled],
+        "parts": parts,
+    }
+    # manifest last, so readers never see a half-written part
+    tmp = directory / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    tmp.replace(directory / MANIFEST)
+
+    for part in replaced:
+        (directory / part).unlink(missing_ok=True)
+
+    return written, manifest
+
+
+def _record_batch(rows):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema())],
+        schema=schema(),
+    )
+
+
+def load_table():
+    """All snapshot parts as one memory-mapped table, reopened only when the manifest changes"""
+    require_pyarrow()
+    manifest = read_manifest()
+    if not manifest["parts"]:
+        raise SnapshotError("No ledger snapshot yet, run `manage.py snapshot_ledger`.")
+
+    with _cache_lock:
+        version, table = _cache.get(current_company(), (None, None))
+        if version != manifest["version"]:
+            tables = [
+                pa.ipc.open_file(pa.memory_map(str(snapshot_dir() / part))).read_all()
+                for part in manifest["parts"]
+            ]
+            table = pa.concat_tables(tables)
+            _cache[current_company()] = (manifest["version"], table)
+        return table
+
+
+def spend_by(group_by, transaction_type="OUT"):
+    """SUM / COUNT of amount per group_by column (None type = both directions)"""
+    table = load_table()
+    if transaction_type:
+        table = table.filter(pc.equal(table["transaction_type"], transaction_type))
+
+    result = table.group_by(group_by).aggregate([("amount", "sum"), ("amount", "count")])
+    result = result.sort_by([("amount_sum", "descending")])
+
+    return [
+        {group_by: row[group_by], "total": row["amount_sum"], "count": row["amount_count"]}
+        for row in result.to_pylist()
+    ]
+
+
+def client_profitability():
+    """Income, expenses and profit per client (project-linked ledger rows only)"""
+    table = load_table()
+    table = table.filter(pc.is_valid(table["project_id"]))
+
+    totals = table.group_by(["client_name", "transaction_type"]).aggregate([("amount", "sum")])
+
+    clients = {}
+    for row in totals.to_pylist():
+        client = clients.setdefault(row["client_name"], {"client_name": row["client_name"], "income": 0, "expenses": 0})
+        client["income" if row["transaction_type"] == "IN" else "expenses"] += row["amount_sum"]
+
+    results = []
+    for client in clients.values():
+        client["profit"] = client["income"] - client["expenses"]
+        results.append(client)
+
+    return sorted(results, key=lambda c: c["profit"], reverse=True)
@@ -0,0 +1,118 @@
+"""
+Runs several API calls inside one HTTP request (/api/batch/).
+
+Sub-requests go straight to the resolved DRF views, reusing the outer request's
+user, session and middleware work. Consecutive reads run concurrently
+(BATCH_MAX_WORKERS threads); a write waits for everything before it and
+finishes before anything after it starts. Results come back in request order.
+"""
+import contextvars
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, Resolver404
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+API_PREFIX = "/api/"
+BATCH_PATH = "/api/batch/"
+
+
+def build_request(parent, method, path, body=None):
+    """A sub-request sharing the parent's headers, cookies, user and session"""
+    path, _, query = path.partition("?")
+    payload = json.dumps(body).encode() if body is not None else b""
+
+    sub = HttpRequest()
+    sub.method = method
+    sub.path = sub.path_info = path
+    sub.META = {
+        **parent.META,
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(payload)),
+    }
+    sub.GET = QueryDict(query)
+    sub.COOKIES = parent.COOKIES
+    sub._stream = io.BytesIO(payload)
+    sub._read_started = False
+
+    for attr in ("user", "session"):
+        if hasattr(parent, attr):
+            setattr(sub, attr, getattr(parent, attr))
+
+    return sub
+
+
+def call(parent, item):
+    path = item["path"]
+    if not path.startswith(API_PREFIX) or path.startswith(BATCH_PATH):
+        return {"status": 400, "body": {"detail": f"Path must be an API endpoint: {path}"}}
+
+    try:
+        match = resolve(path.partition("?")[0])
+    except Resolver404:
+        match = None
+
+    # unknown API paths fall through to the frontend's catch-all view
+    if match is None or not hasattr(match.func, "cls"):
+        return {"status": 404, "body": {"detail": "Not found."}}
+
+    sub = build_request(parent, item["method"], path, item.get("body"))
+    sub.resolver_match = match
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+    except Exception:
+        # one broken sub-request shouldn't take the whole batch down
+        logger.exception("Batch sub-request %s %s failed", item["method"], path)
+        return {"status": 500, "body": {"detail": "Server error."}}
+
+    return {"status": response.status_code, "body": response.data}
+
+
+def _call_in_thread(parent, item):
+    try:
+        return call(parent, item)
+    finally:
+        # worker threads open their own connections, don't leak them
+        connections.close_all()
+
+
+def run_batch(parent, items):
+    results = [None] * len(items)
+    workers = settings.BATCH_MAX_WORKERS
+
+    reads = []  # indexes of the current run of consecutive reads
+
+    def flush_reads():
+        if len(reads) > 1 and workers > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(reads))) as pool:
+                futures = {
+                    index: pool.submit(contextvars.copy_context().run, _call_in_thread, parent, items[index])
+                    for index in reads
+                }
+            for index, future in futures.items():
+                results[index] = future.result()
+        else:
+            for index in reads:
+                results[index] = call(parent, items[index])
+        reads.clear()
+
+    for index, item in enumerate(items):
+        if item["method"] in SAFE_METHODS:
+            reads.append(index)
+            continue
+
+        flush_reads()
+        results[index] = call(parent, item)
+
+    flush_reads()
+    return results
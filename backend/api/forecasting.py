@@ -0,0 +1,135 @@
+import math
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, F
+from django.utils import timezone
+
+from .models import ProjectWallet, ProjectItem, Transaction
+from core.routers import read_from_primary
+from core.tenants import current_company, tenant_db
+
+FORECAST_CACHE_KEY = "project_forecast"
+FORECAST_CACHE_TIMEOUT = 60 * 60
+
+CENTS = Decimal("0.01")
+
+
+def cache_key(company_id=None):
+    return f"{FORECAST_CACHE_KEY}:{company_id or current_company()}"
+
+
+def invalidate_forecast(company_id=None):
+    """Drops a company's cached portfolio forecast (called after new postings)"""
+    cache.delete(cache_key(company_id))
+
+
+def invalidate_forecast_on_commit(company_id=None):
+    """Drops the cached forecast once the current write commits (right away outside a transaction)"""
+    transaction.on_commit(partial(invalidate_forecast, company_id), using=tenant_db())
+
+
+def get_forecast(today=None):
+    """Cached forecast, recomputed when invalidated or when the day rolls over"""
+    today = today or timezone.localdate()
+
+    cached = cache.get(cache_key())
+    if cached is not None and cached["as_of"] == today:
+        return cached
+
+    # cached for an hour, so never built from a replica that may lag the write that invalidated it
+    with read_from_primary():
+        forecast = build_forecast(today)
+    cache.set(cache_key(), forecast, FORECAST_CACHE_TIMEOUT)
+    return forecast
+
+
+def build_forecast(today):
+    """
+    Burn rate and budget exhaustion for every ACTIVE project.
+    Uses one grouped query per level (projects, items) instead of per-project aggregates.
+    """
+    projects = list(
+        ProjectWallet.objects.filter(company=current_company(), status="ACTIVE")
+        .values("id", "name", "client_name", "allocated_budget", "created_at")
+        .order_by("id")
+    )
+
+    # spend per project & per item, all active projects at once
+    expenses = Transaction.objects.filter(
+        project__company=current_company(), project__status="ACTIVE", transaction_type="OUT"
+    )
+    project_spend = dict(
+        expenses.values_list("project").annotate(total=Sum("amount")).order_by()
+    )
+    item_spend = dict(
+        expenses.filter(project_item__isnull=False)
+        .values_list("project_item").annotate(total=Sum("amount")).order_by()
+    )
+
+    items_by_project = {}
+    items = (
+        ProjectItem.objects.filter(project__company=current_company(), project__status="ACTIVE")
+        .annotate(planned=F("qty_amount") * F("volume_amount") * F("period_amount") * F("unit_price"))
+        .values("id", "project", "category", "name", "planned")
+        .order_by("id")
+    )
+    for item in items:
+        items_by_project.setdefault(item["project"], []).append(item)
+
+    results = []
+    for project in projects:
+        budget = project["allocated_budget"]
+        spent = project_spend.get(project["id"]) or Decimal(0)
+        remaining = budget - spent
+
+        # days since kickoff, counting today
+        start = timezone.localdate(project["created_at"])
+        elapsed_days = max((today - start).days + 1, 1)
+        burn_rate = spent / elapsed_days
+
+        days_left = None
+        exhaustion_date = None
+        if remaining <= 0:
+            days_left = 0
+            exhaustion_date = today
+        elif burn_rate > 0:
+            days_left = math.ceil(remaining / burn_rate)
+            exhaustion_date = today + timedelta(days=days_left)
+
+        item_rows = []
+        for item in items_by_project.get(project["id"], []):
+            item_spent = item_spend.get(item["id"]) or Decimal(0)
+            item_rate = item_spent / elapsed_days
+
+            # spend this item reaches by the time the project runs dry
+            projected = item_spent + item_rate * (days_left or 0)
+
+            item_rows.append({
+                "id": item["id"],
+                "name": item["name"],
+                "category": item["category"],
+                "planned": item["planned"],
+                "realized_spend": item_spent,
+                "burn_rate": item_rate.quantize(CENTS),
+                "projected_spend": projected.quantize(CENTS),
+                "trending_over_plan": projected > item["planned"],
+            })
+
+        results.append({
+            "id": project["id"],
+            "name": project["name"],
+            "client_name": project["client_name"],
+            "allocated_budget": budget,
+            "total_spent": spent,
+            "remaining_budget": remaining,
+            "burn_rate": burn_rate.quantize(CENTS),
+            "days_left": days_left,
+            "exhaustion_date": exhaustion_date,
+            "items": item_rows,
+        })
+
+    return {"as_of": today, "projects": results}
@@ -0,0 +1,157 @@
+"""
+Group commit for postings against the same bank account.
+
+The first posting for an account becomes the batch leader: it waits
+GROUP_COMMIT_WINDOW_MS for more postings to arrive, then validates them in
+arrival order and applies the accepted ones in a single database transaction
+(one account lock, one balance write, one commit). Each caller still gets its
+own result, including its own "Insufficient funds" / "Over Budget" error.
+
+Batches only form between threads of the same process, per database.
+A follower whose posting hasn't been picked up by its leader within
+GROUP_COMMIT_TIMEOUT_MS withdraws it and gets GroupCommitTimeout; nothing
+was written, so it's safe to retry.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+
+from .models import BankAccount, ProjectWallet
+from core.tenants import tenant_db
+
+_lock = threading.Lock()
+_pending = {}  # (database, account pk) -> postings waiting for the leader
+
+
+class GroupCommitTimeout(Exception):
+    """The batch leader never got to this posting, it was not written"""
+
+
+class _Posting:
+    def __init__(self, txn, args, kwargs):
+        self.txn = txn
+        self.args = args
+        self.kwargs = kwargs
+        self.error = None
+        self.done = threading.Event()
+        # guarded by _lock: taken by the leader / given up by its caller
+        self.claimed = False
+        self.cancelled = False
+
+
+def _claim(posting):
+    """Takes a posting for the batch, False when its caller already gave up on it"""
+    with _lock:
+        if posting.cancelled:
+            return False
+        posting.claimed = True
+        return True
+
+
+def _withdraw(key, posting):
+    """Gives up on a posting the leader hasn't taken yet, False if it's already being committed"""
+    with _lock:
+        if posting.claimed:
+            return False
+        posting.cancelled = True
+
+        waiting = _pending.get(key)
+        if waiting and posting in waiting:
+            waiting.remove(posting)
+            if not waiting:
+                del _pending[key]
+        return True
+
+
+def submit(txn, *args, **kwargs):
+    """Posts `txn` as part of a batch, blocks until the batch is committed"""
+    posting = _Posting(txn, args, kwargs)
+    account_pk = txn.account.pk
+    # tenant databases reuse primary keys
+    key = (tenant_db(), account_pk)
+
+    with _lock:
+        leader = key not in _pending
+        batch = _pending.setdefault(key, [])
+        batch.append(posting)
+
+    if leader:
+        try:
+            time.sleep(settings.GROUP_COMMIT_WINDOW_MS / 1000)
+        finally:
+            # even when interrupted, or the followers would wait for nobody
+            with _lock:
+                batch = _pending.pop(key)
+            _commit(account_pk, batch)
+    elif not posting.done.wait(settings.GROUP_COMMIT_TIMEOUT_MS / 1000):
+        if _withdraw(key, posting):
+            raise GroupCommitTimeout(
+                f"Posting to account {account_pk} timed out waiting for its group commit, nothing was written."
+            )
+        # the leader's transaction has it, its outcome is ours
+        posting.done.wait()
+
+    if posting.error is not None:
+        raise posting.error
+
+
+def _commit(account_pk, batch):
+    try:
+        with transaction.atomic(using=tenant_db()):
+            account_obj = BankAccount.objects.select_for_update().get(pk=account_pk)
+
+            # sharded since the postings were submitted: slots take them one by one
+            if account_obj.shard_count:
+                for posting in batch:
+                    if not _claim(posting):
+                        continue
+                    posting.txn.account = account_obj
+                    try:
+                        posting.txn._save_sharded(*posting.args, **posting.kwargs)
+                    except Exception as exc:
+                        posting.error = exc
+                return
+
+            # every project in the batch, locked in pk order like any other writer would
+            project_pks = sorted({p.txn.project_id for p in batch if p.txn.project_id})
+            projects = {
+                project.pk: project
+                for project in ProjectWallet.objects.select_for_update().filter(pk__in=project_pks).order_by('pk')
+            }
+
+            bumps = {}  # project pk -> expenses posted against it
+            for posting in batch:
+                if not _claim(posting):
+                    continue
+                txn = posting.txn
+                project_obj = projects.get(txn.project_id)
+                try:
+                    # remaining_budget sees earlier postings of this batch, they're already inserted
+                    txn.validate_posting(account_obj, project_obj)
+
+                    with transaction.atomic(using=tenant_db()):
+                        txn.apply_item_spend()
+                        models.Model.save(txn, *posting.args, **posting.kwargs)
+                except Exception as exc:
+                    posting.error = exc
+                    continue
+
+                account_obj.balance += txn.balance_delta
+                if txn.touches_budget:
+                    bumps[project_obj.pk] = bumps.get(project_obj.pk, 0) + 1
+
+            account_obj.save_balance()
+            for project_pk, count in bumps.items():
+                ProjectWallet.objects.filter(pk=project_pk).update(version=F('version') + count)
+    except Exception as exc:
+        # the whole batch rolled back, nobody got posted
+        for posting in batch:
+            if posting.error is None:
+                posting.txn.pk = None
+                posting.error = exc
+    finally:
+        for posting in batch:
+            posting.done.set()
@@ -0,0 +1,82 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+
+from api.models import BankAccount, ProjectWallet, Transaction, Transfer
+
+MODES = ("locking", "optimistic", "group")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares posting throughput of the balance write modes with concurrent writers on one hot account. "
+        "Bench rows are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500, help="postings per mode")
+        parser.add_argument("--threads", type=int, default=8, help="concurrent writers")
+
+    def handle(self, *args, **options):
+        count, threads = options["count"], options["threads"]
+
+        for mode in MODES:
+            with override_settings(BALANCE_WRITE_MODE=mode):
+                elapsed, failed, consistent = self.run_mode(count, threads)
+            self.stdout.write(
+                f"{mode:<11} {count} postings / {threads} threads in {elapsed * 1000:,.1f} ms "
+                f"({elapsed / count * 1_000_000:,.0f} us/posting), {failed} failed, "
+                f"balances {'consistent' if consistent else 'INCONSISTENT'}"
+            )
+
+    def run_mode(self, count, threads):
+        main = BankAccount.objects.create(name="__bench_main__", balance=Decimal(count * 10))
+        spare = BankAccount.objects.create(name="__bench_spare__", balance=0)
+        project = ProjectWallet.objects.create(
+            name="__bench__", client_name="bench", allocated_budget=Decimal(count), status="CANCELLED"
+        )
+
+        def post(i):
+            try:
+                if i % 3 == 0:
+                    Transaction.objects.create(account=main, amount=1, transaction_type="IN", description="bench")
+                elif i % 3 == 1:
+                    Transaction.objects.create(
+                        account=main, project=project, amount=1, transaction_type="OUT", description="bench"
+                    )
+                else:
+                    Transfer.objects.create(from_account=main, to_account=spare, amount=1)
+                return True
+            except Exception:
+                # e.g. "database is locked" on SQLite
+                return False
+            finally:
+                connections.close_all()
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                results = list(pool.map(post, range(count)))
+            elapsed = time.perf_counter() - start
+
+            # money in = money out, whatever got posted
+            posted_in = Transaction.objects.filter(account=main, transaction_type="IN").count()
+            posted_out = Transaction.objects.filter(account=main, transaction_type="OUT").count()
+            moved = Transfer.objects.filter(from_account=main).count()
+            main.refresh_from_db()
+            spare.refresh_from_db()
+            consistent = (
+                main.total_balance == count * 10 + posted_in - posted_out - moved
+                and spare.total_balance == moved
+            )
+            return elapsed, results.count(False), consistent
+        finally:
+            Transfer.objects.filter(from_account=main).delete()
+            Transaction.objects.filter(account=main).delete()
+            project.delete()
+            main.delete()
+            spare.delete()
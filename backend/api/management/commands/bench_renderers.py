@@ -0,0 +1,60 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.models import ProjectWallet, Transaction
+from api.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from api.serializers import ProjectWalletSerializer, TransactionSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Command(BaseCommand):
+    help = "Compares render time and payload size of the stock and fast renderers on /projects/ and /transactions/ data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000, help="rows per payload (existing rows are repeated)")
+        parser.add_argument("--repeat", type=int, default=5, help="renders per measurement, best one is kept")
+
+    def handle(self, *args, **options):
+        payloads = {
+            "projects": ProjectWalletSerializer(ProjectWallet.objects.prefetch_related("items"), many=True).data,
+            "transactions": TransactionSerializer(
+                Transaction.objects.select_related("account", "project"), many=True
+            ).data,
+        }
+
+        renderers = [("json (stock)", JSONRenderer())]
+        if orjson is not None:
+            renderers.append(("json (orjson)", FastJSONRenderer()))
+        if msgpack is not None:
+            renderers.append(("msgpack", MessagePackRenderer()))
+
+        for name, rows in payloads.items():
+            if not rows:
+                self.stdout.write(f"{name}: no rows in the database, skipped")
+                continue
+
+            data = [rows[i % len(rows)] for i in range(options["rows"])]
+            self.stdout.write(f"\n{name} ({len(data)} rows)")
+
+            for label, renderer in renderers:
+                elapsed, body = self.measure(renderer, data, options["repeat"])
+                sizes = f"raw {len(body):>10,} B  gzip {len(gzip.compress(body, 6)):>9,} B"
+                if brotli is not None:
+                    sizes += f"  br {len(brotli.compress(body, quality=5)):>9,} B"
+                self.stdout.write(f"  {label:<14} {elapsed * 1000:>8.1f} ms  {sizes}")
+
+    def measure(self, renderer, data, repeat):
+        best, body = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = renderer.render(data)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
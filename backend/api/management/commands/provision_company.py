@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import CompanyWallet
+
+
+class Command(BaseCommand):
+    help = "Creates the tables of a company listed in TENANT_DATABASES and copies its CompanyWallet row there"
+
+    def add_arguments(self, parser):
+        parser.add_argument("company", type=int, help="CompanyWallet id")
+
+    def handle(self, *args, **options):
+        alias = settings.TENANT_DATABASES.get(options["company"])
+        if alias is None:
+            raise CommandError(f"Company {options['company']} has no database in TENANT_DATABASES")
+
+        try:
+            company = CompanyWallet.objects.using("default").get(pk=options["company"])
+        except CompanyWallet.DoesNotExist:
+            raise CommandError(f"No company with id {options['company']}")
+
+        call_command("migrate", database=alias, verbosity=options["verbosity"])
+
+        # same id on both sides, the tenant's accounts & projects point at it
+        CompanyWallet.objects.using(alias).update_or_create(
+            pk=company.pk, defaults={"name": company.name, "balance": company.balance}
+        )
+        self.stdout.write(f"{company.name}: books in database '{alias}'")
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import BankAccount
+from core.tenants import use_company
+
+
+class Command(BaseCommand):
+    help = "Splits a hot bank account's balance into N slots (0 folds it back into a single row)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("account", help="bank account name")
+        parser.add_argument("shards", type=int, help="number of balance slots, 0 to disable")
+        parser.add_argument("--company", type=int, default=settings.DEFAULT_COMPANY_ID, help="CompanyWallet id")
+
+    def handle(self, *args, **options):
+        if options["shards"] < 0:
+            raise CommandError("shards must be 0 or more")
+
+        with use_company(options["company"]):
+            try:
+                account = BankAccount.objects.get(company=options["company"], name=options["account"])
+            except BankAccount.DoesNotExist:
+                raise CommandError(f"No bank account named '{options['account']}'")
+
+            account.set_shard_count(options["shards"])
+            self.stdout.write(
+                f"{account.name}: {account.shard_count} slots, total balance {account.total_balance:,.2f}"
+            )
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.analytics import write_snapshot, SnapshotError
+from core.routers import read_from_replica
+from core.tenants import use_company
+
+
+class Command(BaseCommand):
+    help = "Appends new ledger rows to the columnar analytics snapshot (--full rebuilds it)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="drop existing parts and snapshot every row again")
+        parser.add_argument("--company", type=int, default=settings.DEFAULT_COMPANY_ID, help="CompanyWallet id")
+
+    def handle(self, *args, **options):
+        try:
+            with use_company(options["company"]), read_from_replica():
+                written, manifest = write_snapshot(full=options["full"])
+        except SnapshotError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            f"{written} rows written, {len(manifest['parts'])} parts up to transaction #{manifest['last_id']}"
+        )
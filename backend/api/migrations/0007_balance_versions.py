@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_alter_bankaccount_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankaccount',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projectwallet',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:06
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_realized_spend(apps, schema_editor):
+    ProjectItem = apps.get_model('api', 'ProjectItem')
+    Transaction = apps.get_model('api', 'Transaction')
+
+    spent = (
+        Transaction.objects.filter(project_item=OuterRef('pk'), transaction_type='OUT')
+        .values('project_item')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    ProjectItem.objects.update(
+        realized_spend=Coalesce(Subquery(spent), 0, output_field=models.DecimalField(max_digits=15, decimal_places=2))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_balance_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectitem',
+            name='realized_spend',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15),
+        ),
+        migrations.RunPython(backfill_realized_spend, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='projectitem',
+            index=models.Index(fields=['project', 'realized_spend'], name='item_project_spend_idx'),
+        ),
+    ]
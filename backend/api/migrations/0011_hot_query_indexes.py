@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectwallet',
+            index=models.Index(fields=['status', 'allocated_budget'], name='project_status_budget_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['project', 'transaction_type', 'amount'], name='txn_project_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['project_item', 'transaction_type', 'amount'], name='txn_item_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['date', 'id'], name='txn_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_changelog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='reversal_of',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reversal', to='api.transaction'),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='reversal_of',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reversal', to='api.transfer'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='api.bankaccount'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='api.projectwallet'),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='from_account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transfer_out', to='api.bankaccount'),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='to_account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transfer_in', to='api.bankaccount'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:02
+
+import core.tenants
+import django.db.models.deletion
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+
+def create_default_company(apps, schema_editor):
+    """Existing books (and requests without X-Company) belong to the company this install had so far"""
+    db = schema_editor.connection.alias
+    has_books = any(
+        apps.get_model('api', name).objects.using(db).exists()
+        for name in ('BankAccount', 'ProjectWallet', 'ChangeLog')
+    )
+    # tenant databases get their own company from provision_company
+    if db == DEFAULT_DB_ALIAS or has_books:
+        CompanyWallet = apps.get_model('api', 'CompanyWallet')
+        CompanyWallet.objects.using(db).get_or_create(pk=settings.DEFAULT_COMPANY_ID)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_ledger_reversals'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_default_company, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='bankaccount',
+            name='company',
+            field=models.ForeignKey(default=core.tenants.current_company, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='bank_accounts', to='api.companywallet'),
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='company',
+            field=models.ForeignKey(default=settings.DEFAULT_COMPANY_ID, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.companywallet'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='projectwallet',
+            name='company',
+            field=models.ForeignKey(default=core.tenants.current_company, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='projects', to='api.companywallet'),
+        ),
+        migrations.AlterField(
+            model_name='bankaccount',
+            name='name',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='bankaccount',
+            constraint=models.UniqueConstraint(fields=('company', 'name'), name='unique_account_name_per_company'),
+        ),
+    ]
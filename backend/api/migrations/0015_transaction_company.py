@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_account_company(apps, schema_editor):
+    """Existing entries belong to their account's company"""
+    db = schema_editor.connection.alias
+    BankAccount = apps.get_model('api', 'BankAccount')
+    Transaction = apps.get_model('api', 'Transaction')
+    Transaction.objects.using(db).update(
+        company=Subquery(BankAccount.objects.using(db).filter(pk=OuterRef('account')).values('company')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_company_scoping'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='projectwallet',
+            name='project_status_budget_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='txn_date_id_idx',
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='company',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='api.companywallet'),
+        ),
+        migrations.RunPython(copy_account_company, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='transaction',
+            name='company',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='api.companywallet'),
+        ),
+        migrations.AddIndex(
+            model_name='projectwallet',
+            index=models.Index(fields=['company', 'status', 'allocated_budget'], name='project_company_budget_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['company', 'date', 'id'], name='txn_company_date_id_idx'),
+        ),
+    ]
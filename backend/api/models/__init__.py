@@ -1,3 +1,5 @@
-from .wallets import CompanyWallet, BankAccount
+from .wallets import CompanyWallet, BankAccount, BalanceSlot
 from .projects import ProjectWallet, ProjectItem
 from .transactions import Transaction, Transfer
+from .profiles import RequestProfile
+from .changes import ChangeLog
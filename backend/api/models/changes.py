@@ -0,0 +1,58 @@
+from django.db import connections, models, router
+from django.db.models.expressions import RawSQL
+
+from .wallets import CompanyWallet
+
+class ChangeLog(models.Model):
+    """
+    Append-only log of row changes behind /api/changes/.
+    The sync token orders entries by commit, see commit_token():
+    on SQLite writers commit one at a time, so the id is enough;
+    on Postgres ids are handed out before commit, so entries carry their writer's transaction id.
+    """
+    ACTION_CHOICES = [
+        ("UPSERT", "Created / Updated"),
+        ("DELETE", "Deleted"),
+    ]
+
+    # only the owning company's clients get the entry
+    company = models.ForeignKey(CompanyWallet, on_delete=models.CASCADE, related_name="+")
+    # API resource name, same as the router prefix
+    resource = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default="UPSERT")
+    created_at = models.DateTimeField(auto_now_add=True)
+    # id of the writing transaction (Postgres only)
+    txid = models.BigIntegerField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'txid'], name='changelog_company_txid_idx'),
+        ]
+
+    @classmethod
+    def uses_txid(cls, using):
+        return connections[using].vendor == "postgresql"
+
+    @classmethod
+    def record(cls, company_id, resource, object_id, action="UPSERT"):
+        entry = cls(company_id=company_id, resource=resource, object_id=object_id, action=action)
+        if cls.uses_txid(router.db_for_write(cls)):
+            entry.txid = RawSQL("pg_current_xact_id()::text::bigint", ())
+        entry.save()
+        return entry
+
+    @classmethod
+    def commit_token(cls, using):
+        """
+        Position below which every entry is committed, so none shows up later behind a client's back.
+        Postgres: the oldest transaction still running. Entries at or above it are sent again next time.
+        """
+        if cls.uses_txid(using):
+            with connections[using].cursor() as cursor:
+                cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+                return cursor.fetchone()[0]
+        return cls.objects.using(using).aggregate(models.Max("pk"))["pk__max"] or 0
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.resource}/{self.object_id}"
@@ -0,0 +1,23 @@
+from django.db import models
+
+class RequestProfile(models.Model):
+    """A profiled request, the call stack & SQL timeline live on disk (see api.profiling)"""
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    user = models.CharField(max_length=150)
+
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+
+    profile_file = models.CharField(max_length=255)
+    sql_file = models.CharField(max_length=255)
+    summary = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:,.0f} ms)"
@@ -1,7 +1,8 @@
 from django.db import models
 from django.db.models import Sum, F
 from django.core.exceptions import ValidationError
-from .wallets import BankAccount
+from .wallets import CompanyWallet, BankAccount
+from core.tenants import current_company
 
 class ProjectWallet(models.Model):
     STATUS_CHOICES = [
@@ -10,6 +11,15 @@ class ProjectWallet(models.Model):
         ("CANCELLED", "Cancelled"),
     ]
 
+    COMPANY_FIELD = "company"
+
+    company = models.ForeignKey(
+        CompanyWallet,
+        on_delete=models.PROTECT,
+        default=current_company,
+        editable=False,
+        related_name="projects"
+    )
     name = models.CharField(max_length=100)
     client_name = models.CharField(max_length=100)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="ACTIVE")
@@ -17,7 +27,16 @@ class ProjectWallet(models.Model):
     allocated_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+    # bumped on every expense or budget edit, used by the optimistic write mode
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # covering: check_funds_availability SUM(allocated_budget) of a company's ACTIVE projects
+            models.Index(fields=['company', 'status', 'allocated_budget'], name='project_company_budget_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} (RAB: {self.allocated_budget})"
     
@@ -34,16 +53,18 @@ class ProjectWallet(models.Model):
         return self.allocated_budget - self.total_spent
     
     @classmethod
-    def check_funds_availability(cls, new_rab_amount, exclude_id=None):
+    def check_funds_availability(cls, new_rab_amount, exclude_id=None, company_id=None):
         """
-        Global check:
+        Company-wide check:
         Total Cash in Banks - Total Allocated to Active Projects
         """
+        company_id = company_id or current_company()
+
         # all money in banks
-        total_assets = BankAccount.objects.aggregate(Sum('balance'))['balance__sum'] or 0
+        total_assets = BankAccount.total_assets(company_id)
 
         # count money locked in project
-        query = cls.objects.filter(status="ACTIVE")
+        query = cls.objects.filter(company=company_id, status="ACTIVE")
 
         # if editing a project fund
         if exclude_id:
@@ -60,18 +81,38 @@ class ProjectWallet(models.Model):
     
     def save(self, *args, **kwargs):
         if self.status == "ACTIVE":
-            is_safe, free_cash = self.check_funds_availability(self.allocated_budget, exclude_id=self.pk)
+            is_safe, free_cash = self.check_funds_availability(self.allocated_budget, exclude_id=self.pk, company_id=self.company_id)
 
             if not is_safe:
                 raise ValidationError(
                     f"Insufficient Company Funds! You are trying to allocate {self.allocated_budget:,.2f}, "
                     f"but the company only has {free_cash:,.2f} in available (unlocked) cash."
                 )
-        
+
+        # in SQL, so a budget edit can never reuse the version an optimistic posting checks against
+        bump = not self._state.adding
+        if bump:
+            self.version = F('version') + 1
+
         super().save(*args, **kwargs)
 
+        if bump:
+            self.refresh_from_db(fields=['version'])
+
+        from ..forecasting import invalidate_forecast_on_commit
+        invalidate_forecast_on_commit(self.company_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+
+        from ..forecasting import invalidate_forecast_on_commit
+        invalidate_forecast_on_commit(self.company_id)
+        return result
+
 
 class ProjectItem(models.Model):
+    COMPANY_FIELD = "project__company"
+
     project = models.ForeignKey(
         ProjectWallet,
         related_name="items",
@@ -98,6 +139,14 @@ class ProjectItem(models.Model):
     # prince
     unit_price = models.DecimalField(max_digits=15, decimal_places=2)    
 
+    # sum of OUT transactions against this item, maintained by Transaction.save
+    realized_spend = models.DecimalField(max_digits=15, decimal_places=2, default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'realized_spend'], name='item_project_spend_idx'),
+        ]
+
     @property
     def total_price(self):
 
@@ -124,8 +173,25 @@ class ProjectItem(models.Model):
             raise ValidationError(
                 f"Budget Exceeded! This item cost {this_item_cost:,.2f}, but you only have {remaining:,.2f} remaining in the Project Budget." 
             )
-        
+
+        # never write back a stale realized_spend over concurrent postings
+        if not self._state.adding and 'update_fields' not in kwargs:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'realized_spend'
+            ]
+
         super().save(*args,  **kwargs)
 
+        from ..forecasting import invalidate_forecast_on_commit
+        invalidate_forecast_on_commit(self.project.company_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+
+        from ..forecasting import invalidate_forecast_on_commit
+        invalidate_forecast_on_commit(self.project.company_id)
+        return result
+
     def __str__(self):
         return f"{self.name} - {self.total_price:,.2f}"
@@ -1,7 +1,24 @@
 from django.db import models, transaction
+from django.db.models import F
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from .wallets import BankAccount
+from .wallets import BankAccount, CompanyWallet
 from .projects import ProjectWallet, ProjectItem
+from core.tenants import tenant_db
+
+
+class WriteConflict(Exception):
+    """Raised when an optimistic balance update lost the race to another writer"""
+
+
+def optimistic_mode():
+    return settings.BALANCE_WRITE_MODE == "optimistic"
+
+
+def group_commit_mode():
+    # a batch commits on its own, so callers already inside a transaction post directly
+    return settings.BALANCE_WRITE_MODE == "group" and not transaction.get_connection(tenant_db()).in_atomic_block
+
 
 class Transaction(models.Model):
     TRANSACTION_TYPE = [
@@ -9,17 +26,28 @@ class Transaction(models.Model):
         ("OUT", "Expense"),
     ]
 
+    COMPANY_FIELD = "company"
+
+    # the account's company, copied onto the row so the company's ledger comes straight off an index
+    company = models.ForeignKey(
+        CompanyWallet,
+        on_delete=models.PROTECT,
+        editable=False,
+        related_name="transactions"
+    )
+
+    # the ledger is append-only: accounts / projects with history can't be deleted
     account = models.ForeignKey(
-        BankAccount, 
-        on_delete=models.CASCADE,
+        BankAccount,
+        on_delete=models.PROTECT,
         related_name="transactions"
     )
 
     project = models.ForeignKey(
-        ProjectWallet, 
-        on_delete=models.CASCADE, 
-        null=True, 
-        blank=True, 
+        ProjectWallet,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
         related_name="transactions"
     )
 
@@ -36,10 +64,29 @@ class Transaction(models.Model):
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPE)
     date = models.DateField(auto_now_add=True)
 
+    # set on the entry that cancels another one (see reverse())
+    reversal_of = models.OneToOneField(
+        "self",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="reversal"
+    )
+
+    class Meta:
+        indexes = [
+            # covering: total_spent / item spend SUM(amount) straight from the index
+            models.Index(fields=['project', 'transaction_type', 'amount'], name='txn_project_type_idx'),
+            models.Index(fields=['project_item', 'transaction_type', 'amount'], name='txn_item_type_idx'),
+            # TransactionViewSet: a company's ledger, newest first
+            models.Index(fields=['company', 'date', 'id'], name='txn_company_date_id_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self.pk is not None:
             return super().save(*args, **kwargs)
-        
+
         if self.project_item and not self.project:
             self.project = self.project_item.project
 
@@ -50,36 +97,175 @@ class Transaction(models.Model):
                     f"but you are trying to assign it to '{self.project.name}'."
                 )
 
-        with transaction.atomic():
+        if self.project and self.project.company_id != self.account.company_id:
+            raise ValidationError(
+                f"Mismatch Error! Project '{self.project.name}' and account '{self.account.name}' belong to different companies."
+            )
+
+        self.company_id = self.account.company_id
+
+        # a reversal carries the negated amount of the entry it cancels
+        if self.amount <= 0 and not self.reversal_of_id:
+            raise ValidationError("Transaction amount must be positive.")
+
+        if self.account.shard_count:
+            self._save_sharded(*args, **kwargs)
+        elif optimistic_mode():
+            self._save_optimistic(*args, **kwargs)
+        elif group_commit_mode():
+            from ..group_commit import submit
+            submit(self, *args, **kwargs)
+        else:
+            self._save_locked(*args, **kwargs)
+
+        # burn rates changed, drop the cached forecast once this commits
+        from ..forecasting import invalidate_forecast_on_commit
+        invalidate_forecast_on_commit(self.account.company_id)
+
+    def reverse(self):
+        """
+        Cancels this entry by appending its mirror image (same type, negated amount),
+        posted through the normal write path so balances, RAB spend and item spend
+        are corrected incrementally. The original row is never touched.
+        """
+        with transaction.atomic(using=tenant_db()):
+            original = Transaction.objects.select_for_update().get(pk=self.pk)
+
+            if original.reversal_of_id:
+                raise ValidationError("A reversal entry can't be reversed.")
+            if Transaction.objects.filter(reversal_of=original).exists():
+                raise ValidationError(f"Transaction #{original.pk} has already been reversed.")
+
+            return Transaction.objects.create(
+                account=original.account,
+                project=original.project,
+                project_item=original.project_item,
+                transaction_type=original.transaction_type,
+                amount=-original.amount,
+                description=f"Reversal of #{original.pk}: {original.description}"[:255],
+                reversal_of=original,
+            )
+
+    @property
+    def balance_delta(self):
+        """Effect of this posting on the account balance"""
+        return self.amount if self.transaction_type == "IN" else -self.amount
+
+    @property
+    def touches_budget(self):
+        """Expenses against a project consume its RAB"""
+        return self.transaction_type == "OUT" and self.project_id is not None
+
+    def apply_item_spend(self):
+        """Keeps ProjectItem.realized_spend in step with its expenses"""
+        if self.transaction_type == "OUT" and self.project_item_id:
+            ProjectItem.objects.filter(pk=self.project_item_id).update(
+                realized_spend=F('realized_spend') + self.amount
+            )
+
+    def validate_posting(self, account_obj, project_obj=None):
+        # expenses, and reversals of income, take money out
+        if account_obj.balance + self.balance_delta < 0:
+            raise ValidationError(
+                f"Insufficient funds in {account_obj.name}. "
+                f"Balance: {account_obj.balance}, Requested: {-self.balance_delta:,.2f}"
+            )
+
+        self.validate_budget(project_obj)
+
+    def validate_budget(self, project_obj):
+        if self.transaction_type == "OUT" and project_obj and project_obj.remaining_budget < self.amount:
+            raise ValidationError(
+                f"Over Budget! Project {project_obj.name} "
+                f"Only has {project_obj.remaining_budget:,.2f} remaining."
+            )
+
+    def _save_locked(self, *args, **kwargs):
+        """Pessimistic path: row locks on the account (and project) for the whole posting"""
+        with transaction.atomic(using=tenant_db()):
             account_obj = BankAccount.objects.select_for_update().get(pk=self.account.pk)
 
+            # sharded since the caller loaded it: the row only holds rounding leftovers now
+            if account_obj.shard_count:
+                self.account = account_obj
+                return self._save_sharded(*args, **kwargs)
+
             project_obj = None
             if self.project:
                 project_obj = ProjectWallet.objects.select_for_update().get(pk=self.project.pk)
-            
-            # validations
-            if self.amount <= 0:
-                raise ValidationError("Transaction amount must be positive.")
-
-            if self.transaction_type == "OUT":
-                if account_obj.balance < self.amount:
-                    raise ValidationError(
-                        f"Insufficient funds in {account_obj.name}. "
-                        f"Balance: {account_obj.balance}, Requested: {self.amount:,.2f}"
-                    )
-                
-                if project_obj and project_obj.remaining_budget < self.amount:
-                    raise ValidationError(
-                        f"Over Budget! Project {project_obj.name} "
-                        f"Only has {project_obj.remaining_budget:,.2f} remaining."
-                    )
-
-                account_obj.balance -= self.amount
-            elif self.transaction_type == "IN":
-                account_obj.balance += self.amount
-            
-            account_obj.save()
 
+            self.validate_posting(account_obj, project_obj)
+
+            account_obj.balance += self.balance_delta
+            account_obj.save_balance()
+
+            # keeps optimistic writers honest about the project's remaining budget
+            if self.touches_budget:
+                ProjectWallet.objects.filter(pk=project_obj.pk).update(version=F('version') + 1)
+
+            self.apply_item_spend()
+            super().save(*args, **kwargs)
+
+    def _save_optimistic(self, *args, **kwargs):
+        """
+        Optimistic path: read without locks, then apply with conditional UPDATEs
+        that only succeed if nobody else touched the account / project meanwhile.
+        Falls back to the locking path when retries run out.
+        """
+        for _ in range(settings.OPTIMISTIC_MAX_RETRIES):
+            account_obj = BankAccount.objects.get(pk=self.account.pk)
+
+            # set_shard_count bumps version, so a shard change after this read conflicts below
+            if account_obj.shard_count:
+                self.account = account_obj
+                return self._save_sharded(*args, **kwargs)
+
+            project_obj = None
+            if self.touches_budget:
+                project_obj = ProjectWallet.objects.get(pk=self.project.pk)
+
+            self.validate_posting(account_obj, project_obj)
+
+            try:
+                with transaction.atomic(using=tenant_db()):
+                    delta = self.balance_delta
+                    accounts = BankAccount.objects.filter(pk=account_obj.pk, version=account_obj.version)
+                    if delta < 0:
+                        accounts = accounts.filter(balance__gte=-delta)
+
+                    if not accounts.update(balance=F('balance') + delta, version=F('version') + 1):
+                        raise WriteConflict
+
+                    # no other expense or budget edit hit this project since we read remaining_budget
+                    if project_obj:
+                        projects = ProjectWallet.objects.filter(pk=project_obj.pk, version=project_obj.version)
+                        if not projects.update(version=F('version') + 1):
+                            raise WriteConflict
+
+                    self.apply_item_spend()
+                    super().save(*args, **kwargs)
+                    return
+            except WriteConflict:
+                continue
+
+        self._save_locked(*args, **kwargs)
+
+    def _save_sharded(self, *args, **kwargs):
+        """Hot account path: only the project row and one balance slot get locked"""
+        with transaction.atomic(using=tenant_db()):
+            project_obj = None
+            if self.touches_budget:
+                project_obj = ProjectWallet.objects.select_for_update().get(pk=self.project.pk)
+                self.validate_budget(project_obj)
+
+            if not self.account.apply_to_slots(self.balance_delta):
+                # account was folded back while we were posting
+                return self._save_locked(*args, **kwargs)
+
+            if project_obj:
+                ProjectWallet.objects.filter(pk=project_obj.pk).update(version=F('version') + 1)
+
+            self.apply_item_spend()
             super().save(*args, **kwargs)
 
 
@@ -88,39 +274,138 @@ class Transaction(models.Model):
         return f"[{self.transaction_type}] {self.account.name} : {self.amount}{dest}"
 
 class Transfer(models.Model):
-    
+    COMPANY_FIELD = "from_account__company"
+
     from_account = models.ForeignKey(
         BankAccount, related_name="transfer_out",
-        on_delete=models.CASCADE
+        on_delete=models.PROTECT
     )
 
     to_account = models.ForeignKey(
         BankAccount, related_name="transfer_in",
-        on_delete=models.CASCADE
+        on_delete=models.PROTECT
     )
 
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     date = models.DateTimeField(auto_now_add=True)
 
+    reversal_of = models.OneToOneField(
+        "self",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="reversal"
+    )
+
     def save(self, *args, **kwargs):
         if self.pk is not None:
             return super().save(*args, **kwargs)
-        
-        with transaction.atomic():
+
+        if self.amount <= 0:
+            raise ValidationError("Transfer amount must be positive.")
+
+        if self.from_account.company_id != self.to_account.company_id:
+            raise ValidationError("Transfers between accounts of different companies are not allowed.")
+
+        if self.from_account.shard_count or self.to_account.shard_count:
+            self._save_sharded(*args, **kwargs)
+        elif optimistic_mode():
+            self._save_optimistic(*args, **kwargs)
+        else:
+            self._save_locked(*args, **kwargs)
+
+    def reverse(self):
+        """Cancels this transfer by moving the same amount back (a new Transfer row)"""
+        with transaction.atomic(using=tenant_db()):
+            original = Transfer.objects.select_for_update().get(pk=self.pk)
+
+            if original.reversal_of_id:
+                raise ValidationError("A reversal transfer can't be reversed.")
+            if Transfer.objects.filter(reversal_of=original).exists():
+                raise ValidationError(f"Transfer #{original.pk} has already been reversed.")
+
+            return Transfer.objects.create(
+                from_account=original.to_account,
+                to_account=original.from_account,
+                amount=original.amount,
+                reversal_of=original,
+            )
+
+    def validate_transfer(self, src):
+        if src.balance < self.amount:
+            raise ValidationError(f"Insufficient funds in {src.name} to transfer {self.amount}.")
+
+    def _save_locked(self, *args, **kwargs):
+        with transaction.atomic(using=tenant_db()):
             src = BankAccount.objects.select_for_update().get(pk=self.from_account.pk)
             dst = BankAccount.objects.select_for_update().get(pk=self.to_account.pk)
 
-            if self.amount <= 0:
-                raise ValidationError("Transfer amount must be positive.")
+            # sharded since the caller loaded them
+            if src.shard_count or dst.shard_count:
+                self.from_account, self.to_account = src, dst
+                return self._save_sharded(*args, **kwargs)
+
+            self.validate_transfer(src)
 
-            if src.balance < self.amount:
-                raise ValidationError(f"Insufficient funds in {src.name} to transfer {self.amount}.")
-            
             src.balance -= self.amount
             dst.balance += self.amount
-            
-            src.save()
-            dst.save()
+
+            src.save_balance()
+            dst.save_balance()
+
+            super().save(*args, **kwargs)
+
+    def _save_optimistic(self, *args, **kwargs):
+        for _ in range(settings.OPTIMISTIC_MAX_RETRIES):
+            src = BankAccount.objects.get(pk=self.from_account.pk)
+            dst = BankAccount.objects.get(pk=self.to_account.pk)
+
+            if src.shard_count or dst.shard_count:
+                self.from_account, self.to_account = src, dst
+                return self._save_sharded(*args, **kwargs)
+
+            self.validate_transfer(src)
+
+            try:
+                with transaction.atomic(using=tenant_db()):
+                    debited = BankAccount.objects.filter(
+                        pk=src.pk, version=src.version, balance__gte=self.amount
+                    ).update(balance=F('balance') - self.amount, version=F('version') + 1)
+                    if not debited:
+                        raise WriteConflict
+
+                    credited = BankAccount.objects.filter(
+                        pk=dst.pk, version=dst.version
+                    ).update(balance=F('balance') + self.amount, version=F('version') + 1)
+                    if not credited:
+                        raise WriteConflict
+
+                    super().save(*args, **kwargs)
+                    return
+            except WriteConflict:
+                continue
+
+        self._save_locked(*args, **kwargs)
+
+    def _save_sharded(self, *args, **kwargs):
+        legs = [(self.from_account, -self.amount), (self.to_account, self.amount)]
+
+        with transaction.atomic(using=tenant_db()):
+            # legs in account order, so opposite transfers can't deadlock
+            for account, delta in sorted(legs, key=lambda leg: leg[0].pk):
+                if account.shard_count and account.apply_to_slots(delta):
+                    continue
+
+                account_obj = BankAccount.objects.select_for_update().get(pk=account.pk)
+                # sharded since the caller loaded it
+                if account_obj.shard_count and account_obj.apply_to_slots(delta):
+                    continue
+
+                if delta < 0:
+                    self.validate_transfer(account_obj)
+                account_obj.balance += delta
+                account_obj.save_balance()
 
             super().save(*args, **kwargs)
 
@@ -1,6 +1,15 @@
-from django.db import models
+import random
+from decimal import Decimal, ROUND_DOWN
+
+from django.db import models, transaction
+from django.db.models import Sum, F
+from django.core.exceptions import ValidationError
+
+from core.tenants import current_company, tenant_db
 
 class CompanyWallet(models.Model):
+    COMPANY_FIELD = "pk"
+
     name = models.CharField(max_length=50, default='Main Company Wallet')
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
 
@@ -8,10 +17,152 @@ class CompanyWallet(models.Model):
         return f"{self.name} - Rp. {self.balance:,.2f}"
 
 class BankAccount(models.Model):
-    name = models.CharField(max_length=50, unique=True)
+    # lookup from this model to its owning CompanyWallet, used to scope querysets to a tenant
+    COMPANY_FIELD = "company"
+
+    company = models.ForeignKey(
+        CompanyWallet,
+        on_delete=models.PROTECT,
+        default=current_company,
+        editable=False,
+        related_name="bank_accounts"
+    )
+    name = models.CharField(max_length=50)
     account_number = models.CharField(max_length=50, blank=True, null=True)
 
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
 
+    # bumped on every balance change, used by the optimistic write mode
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    # > 0 spreads the balance over that many BalanceSlot rows (hot accounts), see set_shard_count
+    shard_count = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'name'], name='unique_account_name_per_company'),
+        ]
+
+    # only postings write these, on a row they hold locked (save_balance / set_shard_count)
+    POSTING_FIELDS = ('balance', 'version', 'shard_count')
+
+    def save(self, *args, **kwargs):
+        # a rename must never write back a stale balance over concurrent postings
+        if not self._state.adding and 'update_fields' not in kwargs:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.POSTING_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def save_balance(self):
+        """
+        Writes the balance of a row selected for update, bumping version for optimistic writers.
+        A plain UPDATE like the other write modes: the posting's own receiver logs the account for sync.
+        """
+        self.version += 1
+        BankAccount.objects.filter(pk=self.pk).update(balance=self.balance, version=self.version)
+
+    @property
+    def total_balance(self):
+        """Account balance including its slots (the row balance only holds rounding leftovers once sharded)"""
+        if not self.shard_count:
+            return self.balance
+        slots = self.slots.aggregate(Sum('balance'))['balance__sum'] or 0
+        return self.balance + slots
+
+    @classmethod
+    def total_assets(cls, company_id=None):
+        """All of a company's money in banks, sharded slots included"""
+        company_id = company_id or current_company()
+        rows = cls.objects.filter(company=company_id).aggregate(Sum('balance'))['balance__sum'] or 0
+        slots = BalanceSlot.objects.filter(account__company=company_id).aggregate(Sum('balance'))['balance__sum'] or 0
+        return rows + slots
+
+    def set_shard_count(self, shard_count):
+        """Spreads the whole balance evenly over `shard_count` slots (0 folds it back into the account row)"""
+        with transaction.atomic(using=tenant_db()):
+            account = BankAccount.objects.select_for_update().get(pk=self.pk)
+            slots = list(account.slots.select_for_update().order_by('slot'))
+
+            total = account.balance + sum(s.balance for s in slots)
+            account.slots.all().delete()
+
+            if shard_count:
+                share = (total / shard_count).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+                BalanceSlot.objects.bulk_create([
+                    BalanceSlot(account=account, slot=i, balance=share) for i in range(shard_count)
+                ])
+                # rounding leftover stays on the account row
+                account.balance = total - share * shard_count
+            else:
+                account.balance = total
+
+            account.shard_count = shard_count
+            account.version += 1
+            account.save(update_fields=['balance', 'shard_count', 'version'])
+
+        self.refresh_from_db()
+
+    def apply_to_slots(self, delta):
+        """
+        Adds `delta` to one randomly picked slot, so concurrent postings mostly hit different rows.
+        A debit the picked slot can't cover borrows from the other slots.
+        Returns False when the account has no slots (anymore). Call inside transaction.atomic().
+        """
+        # fast path: the balance check rides in the UPDATE, so no lock is held if it fails
+        picked = BalanceSlot.objects.filter(account=self.pk, slot=random.randrange(self.shard_count))
+        if delta < 0:
+            picked = picked.filter(balance__gte=-delta)
+        if picked.update(balance=F('balance') + delta):
+            return True
+
+        # slot too low: lock every slot in slot order, which can't deadlock with other borrowers
+        slots = list(BalanceSlot.objects.select_for_update().filter(account=self.pk).order_by('slot'))
+        if not slots:
+            return False
+
+        if delta >= 0:
+            slots[0].balance += delta
+            slots[0].save(update_fields=['balance'])
+            return True
+
+        needed = -delta
+        available = sum(s.balance for s in slots)
+        if available < needed:
+            raise ValidationError(
+                f"Insufficient funds in {self.name}. "
+                f"Balance: {available}, Requested: {needed:,.2f}"
+            )
+
+        for slot in sorted(slots, key=lambda s: s.balance, reverse=True):
+            taken = min(slot.balance, needed)
+            slot.balance -= taken
+            slot.save(update_fields=['balance'])
+
+            needed -= taken
+            if not needed:
+                break
+
+        return True
+
+    def __str__(self):
+        return f"{self.name} - Rp. {self.total_balance:,.2f}"
+
+class BalanceSlot(models.Model):
+    """One sub-counter of a sharded BankAccount balance"""
+    account = models.ForeignKey(
+        BankAccount,
+        related_name="slots",
+        on_delete=models.CASCADE
+    )
+    slot = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'slot'], name='unique_balance_slot'),
+        ]
+
     def __str__(self):
-        return f"{self.name} - Rp. {self.balance:,.2f}"
+        return f"{self.account.name} #{self.slot} - Rp. {self.balance:,.2f}"
@@ -0,0 +1,125 @@
+"""
+On-demand profiling of single requests.
+
+A staff user adds `X-Profile: 1` (or `?profile=1`) to a request; the call stack
+(cProfile) and the SQL timeline of that one request are written to
+REQUEST_PROFILE_DIR and listed in the admin under "Request profiles".
+Every other request only pays for the header / query string check.
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+_budget_lock = threading.Lock()
+_budget = {"minute": None, "used": 0}
+
+
+def wants_profile(request):
+    return request.headers.get("X-Profile") == "1" or request.GET.get("profile") == "1"
+
+
+def take_sample():
+    """Caps profiled requests per minute, profiling is not free"""
+    minute = int(time.time() // 60)
+    with _budget_lock:
+        if _budget["minute"] != minute:
+            _budget["minute"], _budget["used"] = minute, 0
+        if _budget["used"] >= settings.REQUEST_PROFILING_MAX_PER_MINUTE:
+            return False
+        _budget["used"] += 1
+        return True
+
+
+class SQLTimeline:
+    """execute_wrapper that records every query with its offset & duration"""
+
+    def __init__(self, alias, started):
+        self.alias = alias
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append({
+                "db": self.alias,
+                "offset_ms": round((start - self.started) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3),
+                "sql": sql,
+            })
+
+
+class RequestProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_PROFILING_ENABLED or not wants_profile(request):
+            return self.get_response(request)
+
+        user = getattr(request, "user", None)
+        if not (user and user.is_staff) or not take_sample():
+            return self.get_response(request)
+
+        return self.profile(request)
+
+    def profile(self, request):
+        started = time.perf_counter()
+        timelines = [SQLTimeline(alias, started) for alias in connections]
+        profiler = cProfile.Profile()
+
+        with ExitStack() as stack:
+            for timeline in timelines:
+                stack.enter_context(connections[timeline.alias].execute_wrapper(timeline))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        queries = sorted((q for t in timelines for q in t.queries), key=lambda q: q["offset_ms"])
+
+        record = self.save(request, profiler, queries, duration_ms)
+        response["X-Profile-Id"] = str(record.pk)
+        return response
+
+    def save(self, request, profiler, queries, duration_ms):
+        from .models import RequestProfile
+
+        directory = Path(settings.REQUEST_PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        stamp = timezone.now().strftime("%Y%m%d-%H%M%S-%f")
+        profile_file = directory / f"{stamp}.prof"
+        sql_file = directory / f"{stamp}.sql.json"
+
+        profiler.dump_stats(profile_file)
+        sql_file.write_text(json.dumps(queries, indent=2))
+
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+
+        return RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:255],
+            user=request.user.get_username(),
+            duration_ms=duration_ms,
+            query_count=len(queries),
+            sql_ms=round(sum(q["duration_ms"] for q in queries), 3),
+            profile_file=str(profile_file),
+            sql_file=str(sql_file),
+            summary=summary.getvalue(),
+        )
@@ -1,7 +1,15 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import CompanyWallet, BankAccount, ProjectWallet, Transaction, Transfer, ProjectItem
-from django.db.models import Sum
 from django.core.exceptions import ValidationError as DjangoValidationError
+from core.tenants import current_company
+
+class CompanyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Foreign keys can only point at rows of the requesting company"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset.filter(**{queryset.model.COMPANY_FIELD: current_company()})
 
 class CompanyWalletSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,6 +21,20 @@ class BankAccountSerializer(serializers.ModelSerializer):
         model = BankAccount
         fields = "__all__"
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # opening balance only, afterwards it moves through postings
+        if self.instance is not None:
+            fields['balance'].read_only = True
+        return fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # sharded accounts keep most of their balance in slots
+        if instance.shard_count:
+            data['balance'] = self.fields['balance'].to_representation(instance.total_balance)
+        return data
+
 class SimpleTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
@@ -20,9 +42,11 @@ class SimpleTransactionSerializer(serializers.ModelSerializer):
 
 class ProjectItemSerializer(serializers.ModelSerializer):
     total_price = serializers.ReadOnlyField() # for Plan RAB
-    realized_spend = serializers.SerializerMethodField() # actual expenses
+    realized_spend = serializers.ReadOnlyField() # actual expenses
     margin = serializers.SerializerMethodField()
     history = SimpleTransactionSerializer(source='related_transactions', many=True, read_only=True)
+
+    serializer_related_field = CompanyRelatedField
     
     class Meta:
         model = ProjectItem
@@ -36,13 +60,8 @@ class ProjectItemSerializer(serializers.ModelSerializer):
             'margin'
         ]
     
-    def get_realized_spend(self, obj):
-        spent = obj.related_transactions.filter(transaction_type="OUT").aggregate(Sum('amount'))['amount__sum']
-        return spent or 0
-    
     def get_margin(self, obj):
-        real_spent = self.get_realized_spend(obj)
-        return obj.total_price - real_spent
+        return obj.total_price - obj.realized_spend
     
     def create(self, validated_data):
         try:
@@ -50,6 +69,13 @@ class ProjectItemSerializer(serializers.ModelSerializer):
         except DjangoValidationError as e:
             raise serializers.ValidationError(e.messages)
 
+class ProjectItemPickerSerializer(serializers.ModelSerializer):
+    total_price = serializers.ReadOnlyField()
+
+    class Meta:
+        model = ProjectItem
+        fields = ['id', 'project', 'category', 'name', 'total_price']
+
 class ProjectWalletSerializer(serializers.ModelSerializer):
     items = ProjectItemSerializer(many=True, read_only=True)
 
@@ -84,6 +110,9 @@ class ProjectWalletSerializer(serializers.ModelSerializer):
 class TransactionSerializer(serializers.ModelSerializer):
     wallet_name = serializers.ReadOnlyField(source='account.name')
     project_name = serializers.ReadOnlyField(source='project.name')
+
+    serializer_related_field = CompanyRelatedField
+
     class Meta:
         model = Transaction
         fields = "__all__"
@@ -93,14 +122,46 @@ class TransactionSerializer(serializers.ModelSerializer):
             wallet = data['account']
             amount = data['amount']
 
-            if wallet.balance < amount:
+            balance = wallet.total_balance
+            if balance < amount:
                 raise serializers.ValidationError(
-                    f"Insufficient funds! {wallet.name} only has Rp {wallet.balance:,.0f}"
+                    f"Insufficient funds! {wallet.name} only has Rp {balance:,.0f}"
                 )
         
         return data
 
 class TransferSerializer(serializers.ModelSerializer):
+    serializer_related_field = CompanyRelatedField
+
     class Meta:
         model = Transfer
         fields = "__all__"
+
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=["GET", "HEAD", "OPTIONS", "POST", "PUT", "PATCH", "DELETE"], default="GET")
+    path = serializers.CharField(max_length=500)
+    body = serializers.JSONField(required=False)
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False, max_length=settings.BATCH_MAX_REQUESTS)
+
+class SimulatedItemSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    qty_amount = serializers.IntegerField(default=1, min_value=0)
+    volume_amount = serializers.IntegerField(default=1, min_value=0)
+    period_amount = serializers.IntegerField(default=1, min_value=0)
+    unit_price = serializers.DecimalField(max_digits=15, decimal_places=2)
+
+class SimulatedChangeSerializer(serializers.Serializer):
+    project = serializers.IntegerField(required=False) # omit for a new project
+    name = serializers.CharField(max_length=100, required=False)
+    allocated_budget = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
+    status = serializers.ChoiceField(choices=ProjectWallet.STATUS_CHOICES, required=False)
+    items = SimulatedItemSerializer(many=True, required=False)
+
+class SimulationScenarioSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    changes = SimulatedChangeSerializer(many=True)
+
+class SimulationSerializer(serializers.Serializer):
+    scenarios = SimulationScenarioSerializer(many=True, max_length=1000)
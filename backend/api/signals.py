@@ -0,0 +1,60 @@
+"""
+Feeds the ChangeLog used by delta sync (/api/changes/).
+
+Postings update balances, budgets and item spend with plain UPDATEs, so the
+receivers for Transaction / Transfer also log the rows those writes touched.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import BankAccount, ProjectWallet, ProjectItem, Transaction, Transfer, ChangeLog
+
+
+@receiver(post_save, sender=BankAccount)
+def log_bank_account(sender, instance, **kwargs):
+    ChangeLog.record(instance.company_id, "bank-accounts", instance.pk)
+
+
+@receiver(post_delete, sender=BankAccount)
+def log_bank_account_delete(sender, instance, **kwargs):
+    ChangeLog.record(instance.company_id, "bank-accounts", instance.pk, "DELETE")
+
+
+@receiver(post_save, sender=ProjectWallet)
+def log_project(sender, instance, **kwargs):
+    ChangeLog.record(instance.company_id, "projects", instance.pk)
+
+
+@receiver(post_delete, sender=ProjectWallet)
+def log_project_delete(sender, instance, **kwargs):
+    ChangeLog.record(instance.company_id, "projects", instance.pk, "DELETE")
+
+
+@receiver([post_save, post_delete], sender=ProjectItem)
+def log_project_item(sender, instance, **kwargs):
+    # items are served nested in their project
+    ChangeLog.record(instance.project.company_id, "projects", instance.project_id)
+
+
+@receiver(post_save, sender=Transaction)
+def log_transaction(sender, instance, created, **kwargs):
+    company_id = instance.account.company_id
+    ChangeLog.record(company_id, "transactions", instance.pk)
+
+    if created:
+        ChangeLog.record(company_id, "bank-accounts", instance.account_id)
+        if instance.project_id:
+            ChangeLog.record(company_id, "projects", instance.project_id)
+
+
+@receiver(post_delete, sender=Transaction)
+def log_transaction_delete(sender, instance, **kwargs):
+    ChangeLog.record(instance.account.company_id, "transactions", instance.pk, "DELETE")
+
+
+@receiver(post_save, sender=Transfer)
+def log_transfer(sender, instance, created, **kwargs):
+    if created:
+        company_id = instance.from_account.company_id
+        ChangeLog.record(company_id, "bank-accounts", instance.from_account_id)
+        ChangeLog.record(company_id, "bank-accounts", instance.to_account_id)
@@ -0,0 +1,107 @@
+from decimal import Decimal
+
+from django.db.models import Sum, F
+
+from .models import BankAccount, ProjectWallet, ProjectItem
+from core.tenants import current_company
+
+
+class Portfolio:
+    """
+    Snapshot of company cash, locked funds and project plans, loaded once.
+    Scenarios are evaluated against it in memory with the same rules as
+    ProjectWallet.save (free cash) and ProjectItem.save (plan <= RAB),
+    nothing is written to the database.
+    """
+
+    def __init__(self, total_assets, projects):
+        self.total_assets = total_assets
+        self.projects = projects
+        self.locked_funds = sum(
+            (p["budget"] for p in projects.values() if p["status"] == "ACTIVE"), Decimal(0)
+        )
+
+    @classmethod
+    def load(cls, company_id=None):
+        company_id = company_id or current_company()
+
+        planned = dict(
+            ProjectItem.objects.filter(project__company=company_id).values_list("project")
+            .annotate(total=Sum(F("qty_amount") * F("volume_amount") * F("period_amount") * F("unit_price")))
+            .order_by()
+        )
+
+        projects = {}
+        for pk, name, status, budget in ProjectWallet.objects.filter(company=company_id).values_list("pk", "name", "status", "allocated_budget"):
+            projects[pk] = {
+                "name": name,
+                "status": status,
+                "budget": budget,
+                "planned": Decimal(planned.get(pk) or 0),
+            }
+
+        return cls(Decimal(BankAccount.total_assets(company_id)), projects)
+
+    def run(self, scenario):
+        overlay = {}  # only the projects this scenario touched
+        locked = self.locked_funds
+        errors = []
+
+        for index, change in enumerate(scenario["changes"]):
+            pk = change.get("project")
+            if pk is not None and pk not in self.projects:
+                errors.append(f"Change {index + 1}: project {pk} does not exist.")
+                continue
+
+            key = pk if pk is not None else f"new-{index + 1}"
+            current = overlay.get(key) or self.projects.get(key)
+            if current is None:
+                current = {"name": "New project", "status": "ACTIVE", "budget": Decimal(0), "planned": Decimal(0)}
+
+            project = dict(current)
+            for field, attr in (("name", "name"), ("status", "status"), ("allocated_budget", "budget")):
+                if field in change:
+                    project[attr] = change[field]
+
+            # ProjectWallet.save: an ACTIVE budget has to fit in the unlocked cash
+            locked_without = locked - (current["budget"] if current["status"] == "ACTIVE" else 0)
+            if project["status"] == "ACTIVE":
+                free_cash = self.total_assets - locked_without
+                if project["budget"] > free_cash:
+                    errors.append(
+                        f"{project['name']}: Insufficient Company Funds! You are trying to allocate "
+                        f"{project['budget']:,.2f}, but the company only has {free_cash:,.2f} in available (unlocked) cash."
+                    )
+                    continue
+
+            # ProjectItem.save: every planned item has to fit in the RAB
+            for item in change.get("items", []):
+                cost = item["qty_amount"] * item["volume_amount"] * item["period_amount"] * item["unit_price"]
+                if project["planned"] + cost > project["budget"]:
+                    errors.append(
+                        f"{project['name']}: Budget Exceeded! {item['name']} costs {cost:,.2f}, but you only have "
+                        f"{project['budget'] - project['planned']:,.2f} remaining in the Project Budget."
+                    )
+                    continue
+                project["planned"] += cost
+
+            overlay[key] = project
+            locked = locked_without + (project["budget"] if project["status"] == "ACTIVE" else 0)
+
+        return {
+            "name": scenario.get("name", ""),
+            "ok": not errors,
+            "errors": errors,
+            "locked_funds": locked,
+            "free_cash": self.total_assets - locked,
+            "projects": [
+                {
+                    "project": key if isinstance(key, int) else None,
+                    "name": project["name"],
+                    "status": project["status"],
+                    "allocated_budget": project["budget"],
+                    "planned_cost": project["planned"],
+                }
+                for key, project in overlay.items()
+            ],
+        }
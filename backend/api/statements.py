@@ -0,0 +1,136 @@
+from decimal import Decimal
+
+from django.core import signing
+from django.db import connections
+from django.db.models import Case, When, F, Q, Sum, Value, OuterRef, Subquery, IntegerField, CharField, DecimalField
+from django.db.models.functions import Coalesce, Concat, TruncDate
+
+from .models import BankAccount, BalanceSlot, Transaction, Transfer
+
+CURSOR_SALT = "api.statement"
+CENTS = Decimal("0.01")
+
+# entries on the same day: transactions, then outgoing, then incoming transfers
+TRANSACTION, TRANSFER_OUT, TRANSFER_IN = 0, 1, 2
+
+MONEY = DecimalField(max_digits=15, decimal_places=2)
+
+
+def _entries(account):
+    """The three legs of an account's ledger, shaped alike so they can be UNIONed"""
+    transactions = Transaction.objects.filter(account=account).annotate(
+        day=F("date"),
+        kind=Value(TRANSACTION, output_field=IntegerField()),
+        label=F("description"),
+        signed=Case(
+            When(transaction_type="IN", then=F("amount")),
+            default=-F("amount"),
+            output_field=MONEY,
+        ),
+    )
+    transfers_out = Transfer.objects.filter(from_account=account).annotate(
+        day=TruncDate("date"),
+        kind=Value(TRANSFER_OUT, output_field=IntegerField()),
+        label=Concat(Value("Transfer to "), F("to_account__name"), output_field=CharField()),
+        signed=-F("amount"),
+    )
+    transfers_in = Transfer.objects.filter(to_account=account).annotate(
+        day=TruncDate("date"),
+        kind=Value(TRANSFER_IN, output_field=IntegerField()),
+        label=Concat(Value("Transfer from "), F("from_account__name"), output_field=CharField()),
+        signed=F("amount"),
+    )
+    return [(TRANSACTION, transactions), (TRANSFER_OUT, transfers_out), (TRANSFER_IN, transfers_in)]
+
+
+def _before(kind, cursor):
+    """Keyset condition for one leg: (day, kind, id) < cursor"""
+    day, last_kind, last_id = cursor
+    if kind < last_kind:
+        return Q(day__lte=day)
+    if kind > last_kind:
+        return Q(day__lt=day)
+    return Q(day__lt=day) | Q(day=day, id__lt=last_id)
+
+
+def _current_balance(account):
+    """Total balance (slots included) as a subquery, read in the same statement as the first page"""
+    slots = (
+        BalanceSlot.objects.filter(account=OuterRef("pk"))
+        .values("account").annotate(total=Sum("balance")).values("total")
+    )
+    return BankAccount.objects.filter(pk=account.pk).annotate(
+        total=F("balance") + Coalesce(Subquery(slots), Value(0), output_field=MONEY)
+    ).values("total")
+
+
+def encode_cursor(day, kind, entry_id, balance):
+    return signing.dumps([day, kind, entry_id, str(balance)], salt=CURSOR_SALT)
+
+
+def decode_cursor(token):
+    """Raises signing.BadSignature for tampered or malformed cursors"""
+    day, kind, entry_id, balance = signing.loads(token, salt=CURSOR_SALT)
+    return (day, kind, entry_id), Decimal(balance)
+
+
+def statement_page(account, page_size, cursor=None):
+    """
+    One page of the account statement, newest first, with the balance after each entry.
+    The first page is seeded with the current balance and walks backwards, later
+    pages with the balance carried in the cursor. Balances are a window SUM over
+    just this page, so every page costs the same however long the ledger is.
+    """
+    position, balance = decode_cursor(cursor) if cursor else (None, None)
+
+    legs = []
+    for kind, entries in _entries(account):
+        if position:
+            entries = entries.filter(_before(kind, position))
+        legs.append(entries.values_list("day", "kind", "id", "label", "signed"))
+
+    page = legs[0].union(*legs[1:], all=True).order_by("-day", "-kind", "-id")[:page_size + 1]
+    # compiled for the database it runs on (replica / tenant alias), not for "default"
+    page_sql, params = page.query.get_compiler(using=page.db).as_sql()
+
+    seed_sql = "NULL"
+    if balance is None:
+        seed_sql, seed_params = _current_balance(account).query.get_compiler(using=page.db).as_sql()
+        # the seed comes first in the SQL text
+        params = (*seed_params, *params)
+
+    sql = (
+        "SELECT day, kind, id, label, signed, "
+        "SUM(signed) OVER (ORDER BY day DESC, kind DESC, id DESC) AS newer, "
+        f"({seed_sql}) AS seed "
+        f"FROM ({page_sql}) AS page ORDER BY day DESC, kind DESC, id DESC"
+    )
+    with connections[page.db].cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        rows = db_cursor.fetchall()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    results = []
+    for day, kind, entry_id, label, signed, newer, seed in rows:
+        if balance is None:
+            balance = Decimal(str(seed))
+        signed = Decimal(str(signed))
+        results.append({
+            "date": str(day),
+            "type": ("transaction", "transfer_out", "transfer_in")[kind],
+            "id": entry_id,
+            "description": label,
+            "amount": signed.quantize(CENTS),
+            # newer includes this entry, add it back for the balance right after it
+            "balance": (balance - Decimal(str(newer)) + signed).quantize(CENTS),
+        })
+
+    next_cursor = None
+    if has_more:
+        last = results[-1]
+        # the next page continues from the balance before this page's oldest entry
+        next_cursor = encode_cursor(last["date"], rows[-1][1], last["id"], last["balance"] - last["amount"])
+
+    return results, next_cursor
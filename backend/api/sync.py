@@ -0,0 +1,68 @@
+from django.db import router
+
+from .models import BankAccount, ProjectWallet, Transaction, ChangeLog
+from .serializers import BankAccountSerializer, ProjectWalletSerializer, TransactionSerializer
+from core.tenants import current_company
+
+# resource -> (queryset, serializer), matching the list endpoints of the same name
+RESOURCES = {
+    "bank-accounts": (BankAccount.objects.all, BankAccountSerializer),
+    "projects": (lambda: ProjectWallet.objects.prefetch_related("items__related_transactions"), ProjectWalletSerializer),
+    "transactions": (lambda: Transaction.objects.select_related("account", "project"), TransactionSerializer),
+}
+
+
+def log_since(since, token):
+    """ChangeLog entries of the current company committed after token `since`, oldest first"""
+    db = router.db_for_read(ChangeLog)
+    logs = ChangeLog.objects.using(db).filter(company=current_company())
+    if ChangeLog.uses_txid(db):
+        # the token is a transaction horizon: everything from `since` on, in-flight-at-the-time included
+        return logs.filter(txid__gte=since).order_by("txid", "pk")
+    return logs.filter(pk__gt=since, pk__lte=token).order_by("pk")
+
+
+def changes_since(since=None):
+    """
+    Rows changed after token `since` (tombstones for deleted ones) plus the next token.
+    Without a token every row is returned, that's the initial sync.
+    """
+    # taken first, so anything written while we read is sent again next time
+    token = ChangeLog.commit_token(router.db_for_read(ChangeLog))
+
+    changed = {resource: set() for resource in RESOURCES}
+    deleted = {resource: set() for resource in RESOURCES}
+
+    if since is None:
+        changed = {resource: None for resource in RESOURCES}  # everything
+    else:
+        logs = log_since(since, token).filter(resource__in=RESOURCES).values_list("resource", "object_id", "action")
+        # the last action on a row wins
+        for resource, object_id, action in logs:
+            if action == "DELETE":
+                changed[resource].discard(object_id)
+                deleted[resource].add(object_id)
+            else:
+                deleted[resource].discard(object_id)
+                changed[resource].add(object_id)
+
+    changes = {}
+    for resource, (queryset, serializer_class) in RESOURCES.items():
+        rows = queryset()
+        rows = rows.filter(**{rows.model.COMPANY_FIELD: current_company()})
+        if changed[resource] is not None:
+            rows = rows.filter(pk__in=changed[resource]) if changed[resource] else rows.none()
+
+        data = serializer_class(rows, many=True).data
+        changes[resource] = data
+
+        # logged as changed but gone by now
+        if changed[resource]:
+            deleted[resource] |= changed[resource] - {row["id"] for row in data}
+
+    return {
+        "token": str(token),
+        "full": since is None,
+        "changes": changes,
+        "deleted": {resource: sorted(ids) for resource, ids in deleted.items()},
+    }
@@ -1,3 +1,923 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, router, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from . import analytics, forecasting, profiling, renderers
+from .group_commit import GroupCommitTimeout
+from .models import (
+    BankAccount, ChangeLog, CompanyWallet, ProjectWallet, ProjectItem, RequestProfile, Transaction, Transfer
+)
+from .simulation import Portfolio
+from .views import ProjectWalletViewSet
+from core import compression
+from core.routers import PIN_COOKIE, REPLICA_DB, ReplicaRouter, read_from_replica
+from core.tenants import use_company
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on the hot queries and fails when one of them falls back to a
+    full table scan (or sorts rows the index should already deliver in order).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = BankAccount.objects.create(name="Main", balance=1_000_000)
+        cls.project = ProjectWallet.objects.create(name="Expo", client_name="Client", allocated_budget=100_000)
+        cls.item = ProjectItem.objects.create(project=cls.project, category="Venue", name="Hall", unit_price=10_000)
+
+        for i in range(20):
+            Transaction.objects.create(
+                account=cls.account, project_item=cls.item,
+                amount=100 + i, transaction_type="OUT", description=f"Expense {i}",
+            )
+            Transaction.objects.create(
+                account=cls.account, amount=50, transaction_type="IN", description=f"Income {i}",
+            )
+
+    def capture(self, func):
+        """Raw (sql, params) of every SELECT `func` runs, exactly as the database sees them"""
+        queries = []
+
+        def wrapper(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith("SELECT"):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            func()
+
+        self.assertTrue(queries, "no query was captured")
+        return queries
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                return "\n".join(row[-1] for row in cursor.fetchall())
+
+            if connection.vendor == "postgresql":
+                # tiny test tables make a seq scan cheapest, we want to know an index *can* serve it
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN " + sql, params)
+                return "\n".join(row[0] for row in cursor.fetchall())
+
+        self.skipTest(f"no plan checks for {connection.vendor}")
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def assertIndexed(self, func, sorted_by_index=False, index=None):
+        plans = []
+        for sql, params in self.capture(func):
+            plan = self.explain(sql, params)
+            plans.append(plan)
+
+            full_scans = re.findall(r"^\s*SCAN (\w+)$", plan, re.MULTILINE)  # sqlite
+            full_scans += re.findall(r"Seq Scan on (\w+)", plan)  # postgres
+            self.assertFalse(full_scans, f"full table scan on {full_scans}:\n{sql}\n{plan}")
+
+            if sorted_by_index:
+                self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan, f"sort not served by an index:\n{plan}")
+                self.assertNotIn("Sort", plan, f"sort not served by an index:\n{plan}")
+
+        if index:
+            self.assertTrue(any(index in plan for plan in plans), f"{index} not used:\n" + "\n\n".join(plans))
+
+    def test_project_total_spent(self):
+        self.assertIndexed(lambda: self.project.total_spent)
+
+    def test_item_realized_spend(self):
+        # item list with each item's spend and posting history, as the RAB page loads it
+        self.assertIndexed(lambda: self.get(f"/api/project-items/?project={self.project.pk}"))
+
+    def test_locked_funds(self):
+        self.assertIndexed(
+            lambda: ProjectWallet.check_funds_availability(0, exclude_id=self.project.pk, company_id=self.project.company_id),
+            index="project_company_budget_idx",
+        )
+
+    def test_transaction_list_ordering(self):
+        # company-scoped, as the API lists it
+        self.assertIndexed(lambda: self.get("/api/transactions/"), sorted_by_index=True, index="txn_company_date_id_idx")
+
+    def test_unspent_items_picker(self):
+        self.assertIndexed(lambda: self.get(f"/api/project-items/?project={self.project.pk}&unspent=true"))
+
+
+class PostingBehaviour:
+    """
+    The same rules and totals for every balance write mode (see BALANCE_WRITE_MODE).
+    TransactionTestCase, so group commit forms its batches and threads see committed rows.
+    """
+    mode = None
+    shards = 0
+
+    def setUp(self):
+        self.settings_override = override_settings(BALANCE_WRITE_MODE=self.mode, GROUP_COMMIT_WINDOW_MS=20)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        # the flush between tests takes the migration's default company with it
+        CompanyWallet.objects.get_or_create(pk=settings.DEFAULT_COMPANY_ID)
+        self.account = BankAccount.objects.create(name="Main", balance=1000)
+        self.spare = BankAccount.objects.create(name="Spare", balance=0)
+        self.project = ProjectWallet.objects.create(name="Expo", client_name="Client", allocated_budget=500)
+        self.item = ProjectItem.objects.create(project=self.project, category="Venue", name="Hall", unit_price=400)
+        if self.shards:
+            self.account.set_shard_count(self.shards)
+
+    def balance(self, account=None):
+        return BankAccount.objects.get(pk=(account or self.account).pk).total_balance
+
+    def expense(self, amount, **kwargs):
+        return Transaction.objects.create(
+            account=self.account, project=self.project, project_item=self.item,
+            amount=amount, transaction_type="OUT", description="Expense", **kwargs
+        )
+
+    def run_concurrently(self, postings):
+        """Runs every callable in its own thread, returns what they raised"""
+        errors = []
+
+        def run(post):
+            try:
+                post()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(post,)) for post in postings]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_insufficient_funds(self):
+        with self.assertRaisesMessage(ValidationError, "Insufficient funds"):
+            Transaction.objects.create(account=self.account, amount=1500, transaction_type="OUT", description="Too much")
+
+        self.assertEqual(self.balance(), 1000)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_over_budget(self):
+        self.expense(300)
+        with self.assertRaisesMessage(ValidationError, "Over Budget"):
+            self.expense(300)
+
+        self.assertEqual(self.balance(), 700)
+        self.assertEqual(self.project.total_spent, 300)
+
+    def test_transfer_insufficient_funds(self):
+        with self.assertRaisesMessage(ValidationError, "Insufficient funds"):
+            Transfer.objects.create(from_account=self.account, to_account=self.spare, amount=1001)
+
+        self.assertEqual(self.balance(), 1000)
+        self.assertEqual(self.balance(self.spare), 0)
+
+    def test_reversal_restores_totals(self):
+        expense = self.expense(300)
+        reversal = expense.reverse()
+
+        self.assertEqual((reversal.amount, reversal.reversal_of_id), (-300, expense.pk))
+        self.assertEqual(self.balance(), 1000)
+        self.assertEqual(self.project.total_spent, 0)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.realized_spend, 0)
+
+        with self.assertRaisesMessage(ValidationError, "already been reversed"):
+            expense.reverse()
+        with self.assertRaisesMessage(ValidationError, "can't be reversed"):
+            reversal.reverse()
+
+    def test_income_reversal_insufficient_funds(self):
+        income = Transaction.objects.create(account=self.account, amount=200, transaction_type="IN", description="Income")
+        Transfer.objects.create(from_account=self.account, to_account=self.spare, amount=1100)
+
+        with self.assertRaisesMessage(ValidationError, "Insufficient funds"):
+            income.reverse()
+        self.assertEqual(self.balance(), 100)
+        self.assertFalse(Transaction.objects.filter(reversal_of=income).exists())
+
+    def test_transfer_reversal(self):
+        transfer = Transfer.objects.create(from_account=self.account, to_account=self.spare, amount=400)
+        reversal = transfer.reverse()
+
+        self.assertEqual((reversal.from_account_id, reversal.to_account_id), (self.spare.pk, self.account.pk))
+        self.assertEqual(self.balance(), 1000)
+        self.assertEqual(self.balance(self.spare), 0)
+
+        with self.assertRaisesMessage(ValidationError, "already been reversed"):
+            transfer.reverse()
+
+    def test_stale_instance_posts_to_slots(self):
+        stale = BankAccount.objects.get(pk=self.account.pk)
+        BankAccount.objects.get(pk=self.account.pk).set_shard_count(2)
+
+        Transaction.objects.create(account=stale, amount=100, transaction_type="OUT", description="Expense")
+        Transfer.objects.create(from_account=stale, to_account=self.spare, amount=50)
+
+        account = BankAccount.objects.get(pk=self.account.pk)
+        self.assertEqual(account.total_balance, 850)
+        # the row only keeps the rounding leftover, postings went to the slots
+        self.assertEqual(account.balance, 0)
+
+    def test_concurrent_postings(self):
+        postings = []
+        for _ in range(4):
+            postings.append(lambda: self.expense(25))
+            postings.append(lambda: Transaction.objects.create(
+                account=self.account, amount=10, transaction_type="IN", description="Income"
+            ))
+            postings.append(lambda: Transfer.objects.create(from_account=self.account, to_account=self.spare, amount=5))
+
+        self.assertEqual(self.run_concurrently(postings), [])
+
+        self.assertEqual(self.balance(), 1000 - 4 * 25 + 4 * 10 - 4 * 5)
+        self.assertEqual(self.balance(self.spare), 4 * 5)
+        self.assertEqual(self.project.total_spent, 100)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.realized_spend, 100)
+
+    def test_concurrent_expenses_never_overspend(self):
+        # 8 x 100 against 500 of RAB: exactly 5 may go through
+        errors = self.run_concurrently([lambda: self.expense(100) for _ in range(8)])
+
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all("Over Budget" in str(exc) for exc in errors), errors)
+        self.assertEqual(self.balance(), 500)
+        self.assertEqual(self.project.total_spent, 500)
+
+
+class LockingPostingTests(PostingBehaviour, TransactionTestCase):
+    mode = "locking"
+
+
+class OptimisticPostingTests(PostingBehaviour, TransactionTestCase):
+    mode = "optimistic"
+
+
+class GroupCommitPostingTests(PostingBehaviour, TransactionTestCase):
+    mode = "group"
+
+    def test_follower_timeout(self):
+        # the leader holds its batch open longer than a follower is willing to wait
+        with override_settings(GROUP_COMMIT_WINDOW_MS=1000, GROUP_COMMIT_TIMEOUT_MS=100):
+            leader = threading.Thread(target=self.run_concurrently, args=([lambda: self.expense(100)],))
+            leader.start()
+            time.sleep(0.2)
+            errors = self.run_concurrently([lambda: self.expense(50)])
+            leader.join()
+
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], GroupCommitTimeout)
+        # only the leader's posting was written
+        self.assertEqual(list(Transaction.objects.values_list('amount', flat=True)), [Decimal("100.00")])
+        self.assertEqual(self.balance(), 900)
+
+
+class ShardedPostingTests(PostingBehaviour, TransactionTestCase):
+    mode = "locking"
+    shards = 4
+
+
+class BankAccountApiTests(APITestCase):
+    def setUp(self):
+        self.account = BankAccount.objects.create(name="Main", balance=1000)
+
+    def test_put_round_trip_keeps_balance(self):
+        for shards in (0, 4):
+            with self.subTest(shards=shards):
+                self.account.set_shard_count(shards)
+                url = f"/api/bank-accounts/{self.account.pk}/"
+
+                # a client writing back what it read, with the account renamed
+                data = self.client.get(url).json()
+                data["name"] = f"Main {shards}"
+                response = self.client.put(url, data, format="json")
+
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(response.json()["balance"], "1000.00")
+                self.assertEqual(BankAccount.objects.get(pk=self.account.pk).total_balance, 1000)
+
+    def test_balance_not_writable_on_update(self):
+        url = f"/api/bank-accounts/{self.account.pk}/"
+        response = self.client.patch(url, {"balance": "5000.00"}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BankAccount.objects.get(pk=self.account.pk).balance, 1000)
+
+
+class CompanyHeaderTests(APITestCase):
+    def setUp(self):
+        self.other = CompanyWallet.objects.create(name="Other Company")
+        BankAccount.objects.create(name="Main", balance=1000)
+        with use_company(self.other.pk):
+            BankAccount.objects.create(name="Main", balance=50)
+
+    def test_scoped_to_header_company(self):
+        response = self.client.get("/api/bank-accounts/", HTTP_X_COMPANY=str(self.other.pk))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([a["balance"] for a in response.json()], ["50.00"])
+
+    def test_invalid_company(self):
+        response = self.client.get("/api/bank-accounts/", HTTP_X_COMPANY="abc")
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_company(self):
+        unknown = str(self.other.pk + 100)
+        self.assertEqual(self.client.get("/api/bank-accounts/", HTTP_X_COMPANY=unknown).status_code, 404)
+
+        response = self.client.post("/api/bank-accounts/", {"name": "Ghost", "balance": "0"}, HTTP_X_COMPANY=unknown)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(BankAccount.objects.filter(name="Ghost").exists())
+
+
+@skipIf(analytics.pa is None, "pyarrow not installed")
+class LedgerSnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(LEDGER_SNAPSHOT_DIR=directory.name))
+        # batches of 2, so 4 rows fill the last batch exactly
+        self.enterContext(mock.patch.object(analytics, "BATCH_SIZE", 2))
+
+        account = BankAccount.objects.create(name="Main", balance=0)
+        for i in range(4):
+            Transaction.objects.create(account=account, amount=10, transaction_type="IN", description=f"Income {i}")
+        self.last_id = Transaction.objects.latest("pk").pk
+
+    def test_incremental_after_full_batches(self):
+        written, manifest = analytics.write_snapshot()
+        self.assertEqual((written, manifest["last_id"]), (4, self.last_id))
+
+        written, manifest = analytics.write_snapshot()
+        self.assertEqual(written, 0)
+        self.assertEqual(analytics.load_table().num_rows, 4)
+
+    def test_late_commit_below_snapshotted_ids(self):
+        # stands in for a posting whose transaction was still open during the first run
+        late = Transaction.objects.order_by("pk")[1]
+        other = CompanyWallet.objects.create(name="Elsewhere")
+        Transaction.objects.filter(pk=late.pk).update(company=other)
+
+        written, manifest = analytics.write_snapshot()
+        self.assertEqual((written, manifest["last_id"], manifest["safe_id"]), (3, self.last_id, 0))
+
+        Transaction.objects.filter(pk=late.pk).update(company=late.company_id)
+        written, manifest = analytics.write_snapshot()
+        self.assertEqual(written, 1)
+        self.assertEqual(sorted(analytics.load_table()["id"].to_pylist()), sorted(Transaction.objects.values_list("pk", flat=True)))
+
+        # a window later the rows up to last_id are settled and no longer re-read
+        with override_settings(LEDGER_SNAPSHOT_RESCAN_SECONDS=0):
+            written, manifest = analytics.write_snapshot()
+        self.assertEqual((written, manifest["safe_id"], manifest["checkpoints"]), (0, self.last_id, []))
+
+    def test_full_rebuild_replaces_parts(self):
+        _, first = analytics.write_snapshot()
+        written, manifest = analytics.write_snapshot(full=True)
+
+        self.assertEqual(written, 4)
+        self.assertEqual(len(manifest["parts"]), 1)
+        self.assertNotEqual(manifest["parts"], first["parts"])
+        self.assertEqual(sorted(p.name for p in analytics.snapshot_dir().glob("*.arrow")), manifest["parts"])
+        self.assertEqual(analytics.load_table().num_rows, 4)
+
+
+class LedgerAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "secret"))
+        account = BankAccount.objects.create(name="Main", balance=1000)
+        self.expense = Transaction.objects.create(account=account, amount=100, transaction_type="OUT", description="Expense")
+
+    def test_entries_are_read_only(self):
+        url = f"/admin/api/transaction/{self.expense.pk}/change/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        response = self.client.post(url, {"description": "Edited", "amount": "1", "transaction_type": "IN"})
+        self.assertEqual(response.status_code, 403)
+        self.expense.refresh_from_db()
+        self.assertEqual((self.expense.description, self.expense.amount), ("Expense", 100))
+
+    def test_reverse_action(self):
+        response = self.client.post(
+            "/admin/api/transaction/", {"action": "reverse_selected", "_selected_action": [self.expense.pk]}
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Transaction.objects.filter(reversal_of=self.expense).exists())
+        self.assertEqual(BankAccount.objects.get().balance, 1000)
+
+
+class ChangeLogTests(APITestCase):
+    def setUp(self):
+        self.account = BankAccount.objects.create(name="Main", balance=1000)
+        self.spare = BankAccount.objects.create(name="Spare", balance=0)
+
+    def logged(self, resource, object_id):
+        return ChangeLog.objects.filter(resource=resource, object_id=object_id).count()
+
+    def test_posting_logs_account_once(self):
+        for mode in ("locking", "optimistic"):
+            with self.subTest(mode=mode), override_settings(BALANCE_WRITE_MODE=mode):
+                ChangeLog.objects.all().delete()
+                Transaction.objects.create(account=self.account, amount=10, transaction_type="IN", description="Income")
+                Transfer.objects.create(from_account=self.account, to_account=self.spare, amount=5)
+
+                self.assertEqual(self.logged("bank-accounts", self.account.pk), 2)
+                self.assertEqual(self.logged("bank-accounts", self.spare.pk), 1)
+
+    def test_delta_sync(self):
+        token = self.client.get("/api/changes/").json()["token"]
+        txn = Transaction.objects.create(account=self.account, amount=10, transaction_type="IN", description="Income")
+
+        response = self.client.get(f"/api/changes/?since={token}").json()
+        self.assertEqual([t["id"] for t in response["changes"]["transactions"]], [txn.pk])
+        self.assertEqual([a["balance"] for a in response["changes"]["bank-accounts"]], ["1010.00"])
+
+        response = self.client.get(f"/api/changes/?since={response['token']}").json()
+        self.assertEqual(response["changes"]["transactions"], [])
+
+
+class BatchTests(TransactionTestCase):
+    """TransactionTestCase: concurrent reads run on worker threads with their own connections"""
+
+    def setUp(self):
+        CompanyWallet.objects.get_or_create(pk=settings.DEFAULT_COMPANY_ID)
+        self.accounts = [BankAccount.objects.create(name=f"Bank {i}", balance=i * 100) for i in range(3)]
+
+    def batch(self, *requests):
+        response = self.client.post("/api/batch/", {"requests": list(requests)}, content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"]
+
+    def test_get_with_session_needs_no_csrf_token(self):
+        # a staff browser logged into the admin, loading the dashboard
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(User.objects.create_user("staff", password="secret", is_staff=True))
+
+        response = client.get("/api/batch/?path=/api/bank-accounts/&path=/api/projects/")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([r["status"] for r in response.json()["results"]], [200, 200])
+
+        # writes still need the token
+        response = client.post(
+            "/api/batch/", {"requests": [{"method": "GET", "path": "/api/projects/"}]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_get_needs_a_path(self):
+        self.assertEqual(self.client.get("/api/batch/").status_code, 400)
+
+    def test_concurrent_reads_in_request_order(self):
+        results = self.batch(*[
+            {"method": "GET", "path": f"/api/bank-accounts/{account.pk}/"} for account in reversed(self.accounts)
+        ])
+
+        self.assertEqual([r["status"] for r in results], [200] * 3)
+        self.assertEqual([r["body"]["name"] for r in results], ["Bank 2", "Bank 1", "Bank 0"])
+
+    def test_reads_around_a_write(self):
+        results = self.batch(
+            {"method": "GET", "path": "/api/bank-accounts/"},
+            {"method": "GET", "path": "/api/projects/"},
+            {"method": "POST", "path": "/api/bank-accounts/", "body": {"name": "New", "balance": "5.00"}},
+            {"method": "GET", "path": "/api/bank-accounts/"},
+        )
+
+        self.assertEqual([r["status"] for r in results], [200, 200, 201, 200])
+        self.assertEqual(len(results[0]["body"]), 3)
+        self.assertEqual(len(results[3]["body"]), 4)
+
+    def test_bad_paths(self):
+        results = self.batch(
+            {"method": "GET", "path": "/admin/"},
+            {"method": "GET", "path": "/api/batch/"},
+            {"method": "GET", "path": "/api/no-such-thing/"},
+        )
+        self.assertEqual([r["status"] for r in results], [400, 400, 404])
+
+    def test_failing_entry_is_a_500_of_its_own(self):
+        with mock.patch.object(ProjectWalletViewSet, "list", side_effect=RuntimeError("boom")), \
+                self.assertLogs("api.batch", "ERROR"):
+            results = self.batch(
+                {"method": "GET", "path": "/api/projects/"},
+                {"method": "GET", "path": "/api/bank-accounts/"},
+            )
+
+        self.assertEqual(results[0], {"status": 500, "body": {"detail": "Server error."}})
+        self.assertEqual(results[1]["status"], 200)
+
+
+class StatementTests(APITestCase):
+    def setUp(self):
+        self.account = BankAccount.objects.create(name="Main", balance=1000)
+        spare = BankAccount.objects.create(name="Spare", balance=500)
+
+        for i in range(4):
+            Transaction.objects.create(account=self.account, amount=100 + i, transaction_type="IN", description=f"Income {i}")
+            Transaction.objects.create(account=self.account, amount=40 + i, transaction_type="OUT", description=f"Expense {i}")
+            Transfer.objects.create(from_account=self.account, to_account=spare, amount=25)
+            Transfer.objects.create(from_account=spare, to_account=self.account, amount=10 + i)
+        # most of the balance moves to slots, the statement still starts from the total
+        self.account.set_shard_count(3)
+
+    def pages(self, page_size):
+        url = f"/api/bank-accounts/{self.account.pk}/statement/?page_size={page_size}"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            yield response.json()["results"]
+            url = response.json()["next"]
+
+    def test_balances_chain_across_pages(self):
+        pages = list(self.pages(3))
+        entries = [entry for page in pages for entry in page]
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 3, 3, 1])
+        self.assertEqual(len({(e["type"], e["id"]) for e in entries}), 16)
+
+        current = BankAccount.objects.get(pk=self.account.pk).total_balance
+        self.assertEqual(Decimal(entries[0]["balance"]), current)
+        for newer, older in zip(entries, entries[1:]):
+            self.assertEqual(Decimal(older["balance"]), Decimal(newer["balance"]) - Decimal(newer["amount"]))
+        # before the oldest entry: the opening balance
+        self.assertEqual(Decimal(entries[-1]["balance"]) - Decimal(entries[-1]["amount"]), 1000)
+
+    def test_same_entries_whatever_the_page_size(self):
+        small = [entry for page in self.pages(3) for entry in page]
+        (whole,) = self.pages(50)
+        self.assertEqual(small, whole)
+
+    def test_tampered_cursor(self):
+        response = self.client.get(f"/api/bank-accounts/{self.account.pk}/statement/?cursor=bogus")
+        self.assertEqual(response.status_code, 400)
+
+
+@skipIf(renderers.orjson is None, "orjson not installed")
+class FastJSONRendererTests(TestCase):
+    def render_both(self, data, **kwargs):
+        return renderers.FastJSONRenderer().render(data, **kwargs), JSONRenderer().render(data, **kwargs)
+
+    def test_same_values_as_json_renderer(self):
+        data = {
+            "amount": Decimal("1234.50"),
+            "date": datetime.date(2026, 10, 19),
+            "created": datetime.datetime(2026, 10, 19, 8, 30, 15, 123456),
+            "rows": [{"id": 1, "name": "Kas \u2028 Kecil"}, None, True],
+            7: "non-string key",
+        }
+        fast, stock = self.render_both(data)
+
+        self.assertEqual(json.loads(fast), json.loads(stock))
+        # still safe to embed in <script>
+        self.assertNotIn(b"\xe2\x80\xa8", fast)
+
+    def test_falls_back_for_what_orjson_cannot_encode(self):
+        fast, stock = self.render_both({"id": 2 ** 70})
+        self.assertEqual(fast, stock)
+
+    def test_indent_uses_json_renderer(self):
+        fast, stock = self.render_both([1, 2], accepted_media_type="application/json; indent=2")
+        self.assertEqual(fast, stock)
+
+
+class NegotiationAndCompressionTests(APITestCase):
+    def setUp(self):
+        # a list comfortably above COMPRESSION_MIN_SIZE
+        for i in range(30):
+            BankAccount.objects.create(name=f"Bank account number {i}", account_number=f"000-{i:06d}", balance=i)
+
+    @skipIf(renderers.msgpack is None, "msgpack not installed")
+    def test_msgpack(self):
+        response = self.client.get("/api/bank-accounts/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(renderers.msgpack.unpackb(response.content), self.client.get("/api/bank-accounts/").json())
+
+        response = self.client.post(
+            "/api/bank-accounts/", renderers.msgpack.packb({"name": "Packed", "balance": "1.00"}),
+            content_type="application/msgpack", HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()["name"], "Packed")
+
+    def test_small_responses_not_compressed(self):
+        account = BankAccount.objects.first()
+        response = self.client.get(f"/api/bank-accounts/{account.pk}/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_gzip(self):
+        response = self.client.get("/api/bank-accounts/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content)), self.client.get("/api/bank-accounts/").json())
+
+    @skipIf(compression.brotli is None, "brotli not installed")
+    def test_brotli_for_api_payloads_only(self):
+        response = self.client.get("/api/bank-accounts/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(json.loads(compression.brotli.decompress(response.content)), self.client.get("/api/bank-accounts/").json())
+
+        # HTML carries CSRF tokens: gzip, padded against BREACH
+        response = self.client.get("/admin/login/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertGreater(len(gzip.decompress(response.content)), settings.COMPRESSION_MIN_SIZE)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+
+class SimulationParityTests(TestCase):
+    """The simulator has to accept / reject exactly what the real save() paths do"""
+
+    @classmethod
+    def setUpTestData(cls):
+        BankAccount.objects.create(name="Main", balance=10_000)
+        cls.expo = ProjectWallet.objects.create(name="Expo", client_name="Client", allocated_budget=4000)
+        ProjectItem.objects.create(project=cls.expo, category="Venue", name="Hall", unit_price=1000)
+        cls.gala = ProjectWallet.objects.create(name="Gala", client_name="Client", allocated_budget=3000)
+        cls.old = ProjectWallet.objects.create(name="Old", client_name="Client", allocated_budget=2000, status="COMPLETED")
+
+        cls.other = CompanyWallet.objects.create(name="Other Company")
+        with use_company(cls.other.pk):
+            BankAccount.objects.create(name="Main", balance=50_000)
+            cls.foreign = ProjectWallet.objects.create(name="Foreign", client_name="Client", allocated_budget=100)
+
+    def item(self, unit_price, qty_amount=1):
+        return {"name": "Extra", "qty_amount": qty_amount, "volume_amount": 1, "period_amount": 1, "unit_price": Decimal(unit_price)}
+
+    def apply(self, changes):
+        """Runs the changes through ProjectWallet.save / ProjectItem.save, returns (accepted, free cash), rolled back"""
+        accepted = True
+        with transaction.atomic():
+            for change in changes:
+                try:
+                    with transaction.atomic():
+                        if change.get("project") is None:
+                            project = ProjectWallet(name="New project", client_name="Client")
+                        else:
+                            project = ProjectWallet.objects.get(pk=change["project"], company=settings.DEFAULT_COMPANY_ID)
+                        for field in ("name", "status", "allocated_budget"):
+                            if field in change:
+                                setattr(project, field, change[field])
+                        project.save()
+                except (ValidationError, ProjectWallet.DoesNotExist):
+                    accepted = False
+                    continue
+
+                for item in change.get("items", []):
+                    try:
+                        with transaction.atomic():
+                            ProjectItem(project=project, category="Simulated", **item).save()
+                    except ValidationError:
+                        accepted = False
+
+            _, free_cash = ProjectWallet.check_funds_availability(0)
+            transaction.set_rollback(True)
+        return accepted, free_cash
+
+    def assertSameOutcome(self, *changes, ok):
+        result = Portfolio.load().run({"changes": list(changes)})
+        self.assertEqual((result["ok"], result["free_cash"]), self.apply(changes), result["errors"])
+        self.assertEqual(result["ok"], ok, result["errors"])
+
+    def test_edit_active_project(self):
+        self.assertSameOutcome({"project": self.expo.pk, "allocated_budget": Decimal(7000)}, ok=True)
+        self.assertSameOutcome({"project": self.expo.pk, "allocated_budget": Decimal(7001)}, ok=False)
+
+    def test_cancel_project(self):
+        self.assertSameOutcome({"project": self.gala.pk, "status": "CANCELLED"}, ok=True)
+        # the released budget is free for the next change
+        self.assertSameOutcome(
+            {"project": self.gala.pk, "status": "CANCELLED"},
+            {"project": self.expo.pk, "allocated_budget": Decimal(10_000)},
+            ok=True,
+        )
+
+    def test_reactivate_project(self):
+        self.assertSameOutcome({"project": self.old.pk, "status": "ACTIVE"}, ok=True)
+        self.assertSameOutcome({"project": self.old.pk, "status": "ACTIVE", "allocated_budget": Decimal(3001)}, ok=False)
+
+    def test_new_project(self):
+        self.assertSameOutcome({"name": "Launch", "allocated_budget": Decimal(3000), "items": [self.item(3000)]}, ok=True)
+        self.assertSameOutcome({"name": "Launch", "allocated_budget": Decimal(3001)}, ok=False)
+
+    def test_item_over_rab(self):
+        self.assertSameOutcome({"project": self.expo.pk, "items": [self.item(1500, qty_amount=2)]}, ok=True)
+        self.assertSameOutcome({"project": self.expo.pk, "items": [self.item(1500, qty_amount=2), self.item(1)]}, ok=False)
+
+    def test_project_of_another_company(self):
+        self.assertSameOutcome({"project": self.foreign.pk, "allocated_budget": Decimal(1)}, ok=False)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ForecastTests(APITestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.account = BankAccount.objects.create(name="Main", balance=10_000)
+        self.project = ProjectWallet.objects.create(name="Expo", client_name="Client", allocated_budget=1000)
+        self.item = ProjectItem.objects.create(project=self.project, category="Venue", name="Hall", unit_price=100)
+
+    def expense(self, amount, **kwargs):
+        return Transaction.objects.create(
+            account=self.account, project=self.project, amount=amount, transaction_type="OUT", description="Expense", **kwargs
+        )
+
+    def forecast_of(self, project):
+        (row,) = [p for p in forecasting.build_forecast(self.today)["projects"] if p["id"] == project.pk]
+        return row
+
+    def assertDroppedOnCommit(self, write):
+        forecasting.get_forecast()
+        key = forecasting.cache_key()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+            # a concurrent reader would rebuild from pre-commit data, so not before the commit
+            self.assertIsNotNone(cache.get(key))
+        self.assertIsNone(cache.get(key))
+
+    def test_endpoint(self):
+        self.expense(200)
+        response = self.client.get("/api/projects/forecast/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["name"] for p in response.json()["projects"]], ["Expo"])
+        self.assertIsNotNone(cache.get(forecasting.cache_key()))
+
+    def test_posting_drops_cache(self):
+        self.assertDroppedOnCommit(lambda: self.expense(200))
+
+    def test_reversal_drops_cache(self):
+        expense = self.expense(200)
+        self.assertDroppedOnCommit(expense.reverse)
+
+    def test_budget_and_status_edits_drop_cache(self):
+        def edit(**fields):
+            for field, value in fields.items():
+                setattr(self.project, field, value)
+            self.project.save()
+
+        self.assertDroppedOnCommit(lambda: edit(allocated_budget=2000))
+        self.assertDroppedOnCommit(lambda: edit(status="CANCELLED"))
+
+    def test_zero_spend(self):
+        row = self.forecast_of(self.project)
+        self.assertEqual((row["burn_rate"], row["days_left"], row["exhaustion_date"]), (0, None, None))
+
+    def test_overspent_project(self):
+        self.expense(800)
+        self.project.allocated_budget = 500
+        self.project.save()
+
+        row = self.forecast_of(self.project)
+        self.assertEqual((row["remaining_budget"], row["days_left"], row["exhaustion_date"]), (-300, 0, self.today))
+
+    def test_item_trending_over_plan(self):
+        self.expense(60, project_item=self.item)
+
+        # started today: 60 a day leaves ceil(940 / 60) days
+        row = self.forecast_of(self.project)
+        self.assertEqual((row["days_left"], row["exhaustion_date"]), (16, self.today + datetime.timedelta(days=16)))
+
+        (item,) = row["items"]
+        self.assertEqual(item["projected_spend"], Decimal("1020.00"))
+        self.assertTrue(item["trending_over_plan"])
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    "replica" is an alias of the test database connection: a replica that never lags.
+    The router is watched to see where each read was sent. TransactionTestCase, as
+    reads inside a transaction rightly stay on the primary.
+    """
+
+    def setUp(self):
+        replica = {**connections["default"].settings_dict}
+        for databases in (settings.DATABASES, connections.settings):
+            patcher = mock.patch.dict(databases, {REPLICA_DB: replica})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        connections[REPLICA_DB] = connections["default"]
+        self.addCleanup(delattr, connections._connections, REPLICA_DB)
+
+        CompanyWallet.objects.get_or_create(pk=settings.DEFAULT_COMPANY_ID)
+        self.account = BankAccount.objects.create(name="Main", balance=1000)
+
+    def served_by(self, request):
+        """Aliases the router picked for the bank account reads of `request`"""
+        aliases = set()
+        db_for_read = ReplicaRouter.db_for_read
+
+        def watched(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            if model is BankAccount:
+                aliases.add(alias or "default")
+            return alias
+
+        with mock.patch.object(ReplicaRouter, "db_for_read", watched):
+            response = request()
+        return response, aliases
+
+    def test_get_reads_from_replica(self):
+        response, aliases = self.served_by(lambda: self.client.get("/api/bank-accounts/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, {REPLICA_DB})
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post("/api/bank-accounts/", {"name": "Spare", "balance": "0"})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # the cookie rides along on the next request
+        response, aliases = self.served_by(lambda: self.client.get("/api/bank-accounts/"))
+        self.assertEqual(aliases, {"default"})
+        self.assertEqual(len(response.json()), 2)
+
+    def test_reads_inside_transaction_stay_on_primary(self):
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(BankAccount), REPLICA_DB)
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(BankAccount), "default")
+
+    def test_read_only_batch_does_not_pin(self):
+        def batch(*requests):
+            return self.client.post("/api/batch/", {"requests": list(requests)}, content_type="application/json")
+
+        response, aliases = self.served_by(lambda: batch({"method": "GET", "path": "/api/bank-accounts/"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(aliases, {REPLICA_DB})
+
+        response = batch({"method": "PATCH", "path": f"/api/bank-accounts/{self.account.pk}/", "body": {"name": "Renamed"}})
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+
+class RequestProfilingTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(
+            REQUEST_PROFILE_DIR=directory.name, REQUEST_PROFILING_ENABLED=True, REQUEST_PROFILING_MAX_PER_MINUTE=2
+        ))
+        # a fresh per-minute budget for every test
+        self.enterContext(mock.patch.dict(profiling._budget, {"minute": None, "used": 0}))
+
+        BankAccount.objects.create(name="Main", balance=1000)
+        self.staff = User.objects.create_user("staff", password="secret", is_staff=True)
+
+    def get(self):
+        return self.client.get("/api/bank-accounts/?profile=1")
+
+    def test_only_staff_requests_are_profiled(self):
+        self.assertFalse(self.get().has_header("X-Profile-Id"))
+
+        self.client.force_login(User.objects.create_user("clerk", password="secret"))
+        self.assertFalse(self.get().has_header("X-Profile-Id"))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_staff_request_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        record = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual((record.method, record.path, record.user), ("GET", "/api/bank-accounts/?profile=1", "staff"))
+
+        with open(record.sql_file) as sql_file:
+            queries = json.load(sql_file)
+        self.assertEqual(record.query_count, len(queries))
+        self.assertTrue(any("api_bankaccount" in q["sql"] for q in queries))
+        self.assertGreater(os.path.getsize(record.profile_file), 0)
+
+        # no opt-in, no profile
+        self.assertFalse(self.client.get("/api/bank-accounts/").has_header("X-Profile-Id"))
+
+    def test_per_minute_cap(self):
+        self.client.force_login(self.staff)
+        # all within one minute of the budget's clock
+        clock = mock.Mock(time=lambda: 600.0, perf_counter=time.perf_counter)
+        with mock.patch.object(profiling, "time", clock):
+            profiled = [self.get().has_header("X-Profile-Id") for _ in range(3)]
+
+        self.assertEqual(profiled, [True, True, False])
+        self.assertEqual(RequestProfile.objects.count(), 2)
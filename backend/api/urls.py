@@ -6,7 +6,10 @@ from .views import (
     ProjectWalletViewSet,
     ProjectItemViewSet,
     TransactionViewSet,
-    TransferViewSet
+    TransferViewSet,
+    ChangesViewSet,
+    BatchViewSet,
+    AnalyticsViewSet
 )
 
 router = DefaultRouter()
@@ -16,6 +19,9 @@ router.register(r'projects', ProjectWalletViewSet)
 router.register(r'project-items', ProjectItemViewSet)
 router.register(r'transactions', TransactionViewSet)
 router.register(r'transfers', TransferViewSet)
+router.register(r'changes', ChangesViewSet, basename='changes')
+router.register(r'batch', BatchViewSet, basename='batch')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     path('', include(router.urls)),
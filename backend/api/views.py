@@ -1,4 +1,11 @@
-from rest_framework import viewsets, mixins
+from django.core import signing
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import ProtectedError
+from rest_framework import viewsets, mixins, status
+from rest_framework.exceptions import ValidationError, APIException
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from .models import (
     BankAccount,
     CompanyWallet,
@@ -12,35 +19,221 @@ from .serializers import (
     BankAccountSerializer,
     ProjectWalletSerializer,
     ProjectItemSerializer,
+    ProjectItemPickerSerializer,
     TransactionSerializer,
     TransferSerializer,
+    SimulationSerializer,
+    BatchSerializer,
 )
+from .forecasting import get_forecast
+from .statements import statement_page
+from .simulation import Portfolio
+from .sync import changes_since
+from .batch import run_batch, SAFE_METHODS
+from . import analytics
+from core.routers import read_from_replica, PIN_COOKIE
+from core.tenants import current_company
 
-class CompanyWalletViewSet(viewsets.ModelViewSet):
+class CompanyScopedMixin:
+    """Only rows of the requesting company (X-Company header) are visible"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset.filter(**{queryset.model.COMPANY_FIELD: current_company()})
+
+class ProtectedDestroyMixin:
+    """Rows the ledger still points at can't be deleted, answer 400 instead of 500"""
+
+    def perform_destroy(self, instance):
+        try:
+            instance.delete()
+        except ProtectedError:
+            raise ValidationError("Cannot delete: it still has transactions or transfers on record.")
+
+class ReversalDestroyMixin:
+    """DELETE appends a reversal entry instead of removing the row, the ledger is append-only"""
+
+    def destroy(self, request, *args, **kwargs):
+        try:
+            reversal = self.get_object().reverse()
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.messages)
+
+        return Response(self.get_serializer(reversal).data, status=status.HTTP_201_CREATED)
+
+class CompanyWalletViewSet(CompanyScopedMixin, viewsets.ModelViewSet):
     queryset = CompanyWallet.objects.all()
     serializer_class = CompanyWalletSerializer
 
-class BankAccountViewSet(viewsets.ModelViewSet):
+class BankAccountViewSet(CompanyScopedMixin, ProtectedDestroyMixin, viewsets.ModelViewSet):
     queryset = BankAccount.objects.all()
     serializer_class = BankAccountSerializer
 
-class ProjectWalletViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Transactions & transfers newest first with the balance after each, keyset paginated"""
+        account = self.get_object()
+
+        try:
+            page_size = min(int(request.query_params.get('page_size', 50)), 200)
+        except ValueError:
+            raise ValidationError({"page_size": "Must be a number."})
+
+        try:
+            results, next_cursor = statement_page(account, max(page_size, 1), request.query_params.get('cursor'))
+        except signing.BadSignature:
+            raise ValidationError({"cursor": "Invalid cursor."})
+
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+
+        return Response({"account": account.name, "next": next_url, "results": results})
+
+class ProjectWalletViewSet(CompanyScopedMixin, ProtectedDestroyMixin, viewsets.ModelViewSet):
     queryset = ProjectWallet.objects.all()
     serializer_class = ProjectWalletSerializer
 
-class ProjectItemViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def forecast(self, request):
+        """Burn rate & projected RAB exhaustion for all ACTIVE projects"""
+        return Response(get_forecast())
+
+    @action(detail=False, methods=['post'])
+    def simulate(self, request):
+        """What-if RAB allocations, evaluated in memory against one snapshot of the books"""
+        serializer = SimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        portfolio = Portfolio.load()
+        results = [portfolio.run(scenario) for scenario in serializer.validated_data['scenarios']]
+
+        return Response({
+            "total_assets": portfolio.total_assets,
+            "locked_funds": portfolio.locked_funds,
+            "free_cash": portfolio.total_assets - portfolio.locked_funds,
+            "scenarios": results,
+        })
+
+class ProjectItemViewSet(CompanyScopedMixin, viewsets.ModelViewSet):
     queryset = ProjectItem.objects.all()
     serializer_class = ProjectItemSerializer
 
-class TransactionViewSet(mixins.CreateModelMixin,
+    def is_picker(self):
+        return self.request.query_params.get('unspent') == 'true'
+
+    def get_serializer_class(self):
+        # the picker only needs id, name & price, not every item's history
+        if self.is_picker():
+            return ProjectItemPickerSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        # ?project=<id>&unspent=true -> items of one project with no expenses yet (transaction picker)
+        project = self.request.query_params.get('project')
+        if project:
+            try:
+                queryset = queryset.filter(project=int(project))
+            except ValueError:
+                raise ValidationError({"project": "Must be a number."})
+
+        if self.is_picker():
+            return queryset.filter(realized_spend=0)
+
+        return queryset.prefetch_related('related_transactions')
+
+class TransactionViewSet(CompanyScopedMixin,
+                         ReversalDestroyMixin,
+                         mixins.CreateModelMixin,
                          mixins.ListModelMixin,
                          mixins.RetrieveModelMixin,
-                         mixins.DestroyModelMixin,
                          viewsets.GenericViewSet):
     
     queryset = Transaction.objects.all().order_by('-date', '-id')
     serializer_class = TransactionSerializer
 
-class TransferViewSet(viewsets.ModelViewSet):
+class TransferViewSet(CompanyScopedMixin,
+                      ReversalDestroyMixin,
+                      mixins.CreateModelMixin,
+                      mixins.ListModelMixin,
+                      mixins.RetrieveModelMixin,
+                      viewsets.GenericViewSet):
+
     queryset = Transfer.objects.all()
     serializer_class = TransferSerializer
+
+class ChangesViewSet(viewsets.ViewSet):
+    """Delta sync: /changes/?since=<token> returns rows changed after the token"""
+
+    def list(self, request):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({"since": "Invalid token."})
+
+        return Response(changes_since(since))
+
+class BatchViewSet(viewsets.ViewSet):
+    """
+    GET /batch/?path=/api/projects/&path=/api/bank-accounts/ -> several reads at once.
+    POST /batch/ {"requests": [{"method": "POST", "path": "/api/transactions/", "body": {...}}, ...]} for writes.
+    Reads go through GET, a safe method: no CSRF token needed and replica routing as for any other read.
+    """
+
+    def list(self, request):
+        paths = request.query_params.getlist('path')
+        serializer = BatchSerializer(data={"requests": [{"method": "GET", "path": path} for path in paths]})
+        serializer.is_valid(raise_exception=True)
+
+        return Response({"results": run_batch(request._request, serializer.validated_data['requests'])})
+
+    def create(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['requests']
+
+        if not all(item['method'] in SAFE_METHODS for item in items):
+            return Response({"results": run_batch(request._request, items)})
+
+        # reads only: treat it like a GET for replica routing
+        request._request.read_only = True
+        if request.COOKIES.get(PIN_COOKIE):
+            return Response({"results": run_batch(request._request, items)})
+
+        with read_from_replica():
+            return Response({"results": run_batch(request._request, items)})
+
+class SnapshotUnavailable(APIException):
+    status_code = 503
+    default_detail = "Analytics snapshot is not available."
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """Aggregations over the columnar ledger snapshot (`manage.py snapshot_ledger`), not the live tables"""
+
+    def _run(self, func, *args):
+        try:
+            return func(*args)
+        except analytics.SnapshotError as exc:
+            raise SnapshotUnavailable(str(exc))
+
+    @action(detail=False, methods=['get'])
+    def spend(self, request):
+        group_by = request.query_params.get('group_by', 'category')
+        if group_by not in analytics.GROUP_BY_CHOICES:
+            raise ValidationError({"group_by": f"Must be one of: {', '.join(analytics.GROUP_BY_CHOICES)}."})
+
+        transaction_type = request.query_params.get('type', 'OUT').upper()
+        if transaction_type not in ('IN', 'OUT', 'ALL'):
+            raise ValidationError({"type": "Must be IN, OUT or ALL."})
+
+        results = self._run(analytics.spend_by, group_by, None if transaction_type == 'ALL' else transaction_type)
+        return Response({"snapshot": analytics.read_manifest()["last_id"], "results": results})
+
+    @action(detail=False, methods=['get'])
+    def profitability(self, request):
+        results = self._run(analytics.client_profitability)
+        return Response({"snapshot": analytics.read_manifest()["last_id"], "results": results})
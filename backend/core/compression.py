@@ -0,0 +1,53 @@
+"""
+Response compression with a size threshold.
+
+Brotli is used for API payloads (BROTLI_CONTENT_TYPES) when the client accepts it
+and the `brotli` package is installed, everything else goes through Django's
+GZipMiddleware. HTML pages carry CSRF tokens, and only GZipMiddleware pads its
+output against BREACH. Responses below COMPRESSION_MIN_SIZE are sent as-is,
+compressing them costs more than it saves.
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+# no secrets next to attacker-controlled input in these, unlike forms
+BROTLI_CONTENT_TYPES = ("application/json", "application/msgpack")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return super().process_response(request, response)
+
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        ae = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        content_type = response.get("Content-Type", "").partition(";")[0].strip()
+        if brotli is None or content_type not in BROTLI_CONTENT_TYPES or not re_accepts_brotli.search(ae):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        compressed_content = brotli.compress(response.content, quality=settings.BROTLI_QUALITY)
+        if len(compressed_content) >= len(response.content):
+            return response
+
+        response.content = compressed_content
+        response.headers["Content-Length"] = str(len(response.content))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+
+        return response
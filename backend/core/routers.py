@@ -0,0 +1,91 @@
+"""
+Database routing for the optional read replica.
+
+Safe (read-only) API requests and report jobs read from the "replica" alias,
+everything else goes to "default". A client that just wrote gets a short-lived
+cookie that keeps its reads on the primary, so it always sees its own writes.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA_DB = "replica"
+PIN_COOKIE = "pin_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_use_replica = ContextVar("use_replica", default=False)
+
+
+def replica_configured():
+    return REPLICA_DB in settings.DATABASES
+
+
+@contextmanager
+def read_from_replica():
+    """Routes reads inside the block to the replica (for reports & management commands)"""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """Forces reads inside the block back onto the primary"""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or not replica_configured():
+            return None
+
+        # anything inside a write transaction (e.g. select_for_update) stays on the primary
+        if connections["default"].in_atomic_block:
+            return None
+
+        return REPLICA_DB
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Sends safe requests to the replica unless the client wrote recently"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            # e.g. a POST /api/batch/ made only of reads
+            if replica_configured() and not getattr(request, "read_only", False):
+                response.set_cookie(
+                    PIN_COOKIE, "1",
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    samesite="Lax",
+                )
+            return response
+
+        if request.COOKIES.get(PIN_COOKIE):
+            return self.get_response(request)
+
+        with read_from_replica():
+            return self.get_response(request)
@@ -11,7 +11,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from importlib.util import find_spec
 import os
+import json
+
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,20 +51,52 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.RequestProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.tenants.TenantMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
 ]
 
 REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
-    ]
+        "api.renderers.FastJSONRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
+# MessagePack (Accept: application/msgpack) when the optional msgpack package is installed
+if find_spec("msgpack"):
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].append("api.renderers.MessagePackRenderer")
+    REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"].append("api.renderers.MessagePackParser")
+
+# /api/batch/: sub-requests per batch & threads for concurrent reads
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# staff can profile one request with "X-Profile: 1" or "?profile=1"
+REQUEST_PROFILING_ENABLED = os.environ.get('REQUEST_PROFILING_ENABLED', '1') == '1'
+REQUEST_PROFILING_MAX_PER_MINUTE = 10
+REQUEST_PROFILE_DIR = BASE_DIR / 'profiles'
+
+# Arrow files written by `manage.py snapshot_ledger`, read by /api/analytics/
+LEDGER_SNAPSHOT_DIR = os.environ.get('LEDGER_SNAPSHOT_DIR', BASE_DIR / 'snapshots')
+# each snapshot run re-reads this far back for rows that committed late (longer than any posting stays open)
+LEDGER_SNAPSHOT_RESCAN_SECONDS = int(os.environ.get('LEDGER_SNAPSHOT_RESCAN_SECONDS', 3600))
+
+# responses smaller than this (bytes) are not compressed
+COMPRESSION_MIN_SIZE = 1024
+BROTLI_QUALITY = 5
+
 
 ROOT_URLCONF = 'core.urls'
 
@@ -89,10 +125,67 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # writers queue for the lock up front instead of failing with "database is locked"
+        # when concurrent postings upgrade from read to write
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        # a file, not the shared in-memory database: that one fails concurrent writers with
+        # "database table is locked" instead of waiting, and the posting tests run threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Optional read replica for reporting / dashboard reads.
+# Locally, point REPLICA_DB_NAME at a copy of db.sqlite3 (or a second Postgres database).
+if os.environ.get('REPLICA_DB_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': os.environ.get('REPLICA_DB_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.environ['REPLICA_DB_NAME'],
+        'USER': os.environ.get('REPLICA_DB_USER', ''),
+        'PASSWORD': os.environ.get('REPLICA_DB_PASSWORD', ''),
+        'HOST': os.environ.get('REPLICA_DB_HOST', ''),
+        'PORT': os.environ.get('REPLICA_DB_PORT', ''),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Tenants: requests act for the CompanyWallet in their "X-Company" header (DEFAULT_COMPANY_ID without one).
+# Companies in TENANT_DATABASES get a database of their own, as JSON {"<company id>": {<DATABASES entry>}}, e.g.
+#   {"2": {"NAME": "/data/company2.sqlite3"},
+#    "3": {"ENGINE": "django.db.backends.postgresql", "NAME": "wallet", "OPTIONS": {"options": "-c search_path=company3"}}}
+# then `python manage.py provision_company <id>` creates its tables.
+DEFAULT_COMPANY_ID = int(os.environ.get('DEFAULT_COMPANY_ID', 1))
+
+TENANT_DATABASES = {}  # company id -> database alias
+for company_id, config in json.loads(os.environ.get('TENANT_DATABASES', '{}')).items():
+    alias = f'company_{company_id}'
+    DATABASES[alias] = {'ENGINE': 'django.db.backends.sqlite3', **config}
+    TENANT_DATABASES[int(company_id)] = alias
+
+DATABASE_ROUTERS = ['core.tenants.TenantRouter', 'core.routers.ReplicaRouter']
+
+# seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+# Shared by all worker processes, so invalidating a cached forecast reaches every worker.
+# Multi-host deployments: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://...
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / 'cache'),
     }
 }
 
 
+# How Transaction / Transfer update balances:
+#   "locking"    - select_for_update on the account & project (default, best under contention)
+#   "optimistic" - conditional UPDATE ... WHERE version = ?, retried on conflict (low-contention accounts)
+#   "group"      - postings to the same account within GROUP_COMMIT_WINDOW_MS share one commit (month-end load)
+BALANCE_WRITE_MODE = os.environ.get('BALANCE_WRITE_MODE', 'locking')
+OPTIMISTIC_MAX_RETRIES = 5
+GROUP_COMMIT_WINDOW_MS = int(os.environ.get('GROUP_COMMIT_WINDOW_MS', 5))
+# a follower gives up (nothing written) if its batch leader hasn't taken its posting by then
+GROUP_COMMIT_TIMEOUT_MS = int(os.environ.get('GROUP_COMMIT_TIMEOUT_MS', 5000))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -138,3 +231,4 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'x-company')
@@ -0,0 +1,96 @@
+"""
+Company (tenant) scoping.
+
+Every request acts for one CompanyWallet, picked with the "X-Company: <id>"
+header (DEFAULT_COMPANY_ID without it). Companies listed in TENANT_DATABASES
+keep their books in a database of their own (a SQLite file or a Postgres
+schema), so their locks and load never meet the other tenants'. All other
+companies share "default" and are kept apart by their company foreign key.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import JsonResponse
+
+COMPANY_HEADER = "HTTP_X_COMPANY"
+
+# app-wide tables that never move to a tenant database
+SHARED_MODELS = {"requestprofile"}
+
+_company = ContextVar("company", default=None)
+
+
+def current_company():
+    """CompanyWallet id the current request / command acts for"""
+    company = _company.get()
+    return settings.DEFAULT_COMPANY_ID if company is None else company
+
+
+def tenant_db(company_id=None):
+    """Database alias holding a company's books"""
+    if company_id is None:
+        company_id = current_company()
+    return settings.TENANT_DATABASES.get(company_id, DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def use_company(company_id):
+    """Acts for `company_id` inside the block (management commands, jobs)"""
+    token = _company.set(company_id)
+    try:
+        yield
+    finally:
+        _company.reset(token)
+
+
+class TenantRouter:
+    """Sends the books of companies with their own database there, everything else falls through"""
+
+    def _db(self, model):
+        if model._meta.app_label != "api" or model._meta.model_name in SHARED_MODELS:
+            return None
+
+        alias = tenant_db()
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def db_for_read(self, model, **hints):
+        return self._db(model)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # rows of two different tenant databases never point at each other
+        tenant_aliases = settings.TENANT_DATABASES.values()
+        if obj1._state.db != obj2._state.db and (obj1._state.db in tenant_aliases or obj2._state.db in tenant_aliases):
+            return False
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class TenantMiddleware:
+    """Reads the company from the X-Company header for the rest of the request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        company = request.META.get(COMPANY_HEADER)
+        if company is None:
+            return self.get_response(request)
+
+        try:
+            company = int(company)
+        except ValueError:
+            return JsonResponse({"detail": "Invalid X-Company header."}, status=400)
+
+        with use_company(company):
+            # checked on the company's own database, where provision_company put its row
+            if not apps.get_model("api", "CompanyWallet").objects.filter(pk=company).exists():
+                return JsonResponse({"detail": "Unknown company."}, status=404)
+            return self.get_response(request)
@@ -7,4 +7,27 @@ const api = axios.create({
     },
 });
 
+// multi-company installs: the company this browser works for (see README, X-Company)
+const company = localStorage.getItem('company');
+if (company) {
+    api.defaults.headers.common['X-Company'] = company;
+}
+
+// several GETs in one round-trip via GET /api/batch/ (a safe method, so no CSRF token needed),
+// resolves to the response bodies in order
+export const batchGet = async (paths: string[]) => {
+    const res = await api.get('/batch/', {
+        params: { path: paths.map(path => `/api${path}`) },
+        // path=a&path=b, not path[]=a&path[]=b
+        paramsSerializer: { indexes: null },
+    });
+
+    return res.data.results.map((result: { status: number; body: any }, i: number) => {
+        if (result.status >= 400) {
+            throw new Error(`${paths[i]} failed with ${result.status}`);
+        }
+        return result.body;
+    });
+};
+
 export default api;
\ No newline at end of file
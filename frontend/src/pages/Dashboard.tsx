@@ -1,5 +1,5 @@
 import { useEffect, useState } from 'react';
-import api from '../api';
+import { batchGet } from '../api';
 import { 
     Wallet, 
     Lock, 
@@ -43,16 +43,16 @@ const Dashboard = () => {
     useEffect(() => {
         const fetchData = async() => {
             try {
-                const [banksRes, projectRes, txRes] = await Promise.all([
-                    api.get('/bank-accounts'),
-                    api.get('/projects'),
-                    api.get('/transactions')
+                const [banksData, projectData, txData] = await batchGet([
+                    '/bank-accounts/',
+                    '/projects/',
+                    '/transactions/'
                 ]);
                 
-                setBanks(banksRes.data);
-                setProjects(projectRes.data)
+                setBanks(banksData);
+                setProjects(projectData)
                 
-                const recentTx = txRes.data.reverse().slice(0, 5);
+                const recentTx = txData.reverse().slice(0, 5);
                 setTransactions(recentTx);
             } catch (error) {
                 console.error("Error fetching dashboard data:", error);
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
-import api from '../api';
+import api, { batchGet } from '../api';
 import { 
     ArrowLeft, 
     AlertCircle 
@@ -30,11 +30,9 @@ const TransactionCreate = () => {
     useEffect(() => {
         const fetchInitialData = async () => {
         try {
-            const wRes = await api.get('/bank-accounts/');
-            setWallets(wRes.data);
-            
-            const pRes = await api.get('/projects/');
-            setProjects(pRes.data);
+            const [walletData, projectData] = await batchGet(['/bank-accounts/', '/projects/']);
+            setWallets(walletData);
+            setProjects(projectData);
         } catch (err) {
             console.error("Init failed", err);
         }
@@ -51,11 +49,10 @@ const TransactionCreate = () => {
         
         const fetchItems = async () => {
             try {
-                const res = await api.get(`/projects/${formData.project}/`);
-
-                const allItems = res.data.items || [];
-                const availableItems = allItems.filter((item: any) => item.realized_spend === 0)
-                setProjectItems(availableItems);
+                const res = await api.get('/project-items/', {
+                    params: { project: formData.project, unspent: true }
+                });
+                setProjectItems(res.data);
             } catch (err) {
                 console.error("Failed to load items", err);
             }
@@ -66,7 +66,7 @@ const Wallets = () => {
     };
 
     const handleDelete = async (id: number) => {
-        if (!confirm("Are you sure? this will delete the wallet and its history.")) return;
+        if (!confirm("Are you sure? Only wallets without transactions or transfers can be deleted.")) return;
         try {
             await api.delete(`/bank-accounts/${id}/`);
             fetchWallets();